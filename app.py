@@ -1,18 +1,17 @@
 # -*- coding: utf-8 -*-
-from flask import Flask, request, jsonify, send_from_directory, url_for
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context, url_for
 from flask_cors import CORS
-from jobs import enqueue_job
-from datetime import datetime, timezone, timedelta
-import os, uuid
-from utils import try_convert_docx_to_pdf_libreoffice
-
-
-from flask import Flask, request, jsonify
-from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.hazmat.primitives.asymmetric import rsa
-from cryptography.x509.oid import NameOID
-from cryptography import x509
-from cryptography.hazmat.primitives.serialization import pkcs12 
+from jobs import enqueue_job, get_job_status, r as redis_client, queue_key, processing_key, LANE_WORKERS
+import metrics
+from datetime import datetime
+import os, uuid, json, re, time, threading
+from utils import ensure_transcript_docx, pdf_artifact_key, get_cached_artifact, read_transcript_stream, latest_transcript_event_id
+from file_index import record_file, set_chunk_status, sync_index, list_files as list_indexed_files
+import document_store
+from stt_backends import STT_TIERS
+from upload import (UploadError, receive_raw_chunk, receive_multipart_chunks, create_session as create_upload_session,
+                    get_session as get_upload_session, count_session_chunks, close_session as close_upload_session)
+from werkzeug.exceptions import RequestEntityTooLarge
 
 
 from flask import Flask, request, jsonify
@@ -20,11 +19,11 @@ from pyhanko.sign import signers, fields
 from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
 from pyhanko.sign.fields import SigFieldSpec
 from pyhanko.stamp import TextStampStyle
+from pdf_signing import signer_cache, sign_pdf_batch, pfx_path_for
+from keygen import provision_keys, MAX_KEYS_PER_REQUEST
 import os
 import glob
 
-from docx import Document
-
 
 app = Flask(__name__)
 allowed_origins = [
@@ -39,6 +38,13 @@ allowed_origins = [
 CORS(app, origins=allowed_origins, supports_credentials=True)
 MEETINGS_DIR = os.getenv("MEETINGS_DIR", "meetings")
 os.makedirs(MEETINGS_DIR, exist_ok=True)
+# SSE: keepalive interval, and max lifetime of one connection (EventSource reconnects with Last-Event-ID)
+SSE_HEARTBEAT_SECONDS = int(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_MAX_SECONDS = int(os.getenv("SSE_MAX_SECONDS", "300"))
+# Each open stream holds one gthread thread; keep the rest of the pool for the other APIs
+# (default: half of gunicorn's --threads 32, see restart.bash)
+SSE_MAX_STREAMS = max(1, int(os.getenv("SSE_MAX_STREAMS", "16")))
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
 
 @app.route("/api/stt_input", methods=["POST"])
 def stt_input():
@@ -51,14 +57,38 @@ def stt_input():
     full_name = request.form.get("full_name", "")
     role = request.form.get("role", "")
     ts = request.form.get("ts")
+    quality = request.form.get("quality")
 
     if not f or not meeting_id or not user_id:
         return jsonify({"error": "missing file or meeting_id or user_id"}), 400
+    if quality and quality not in STT_TIERS:
+        return jsonify({"error": f"quality must be one of {sorted(STT_TIERS)}"}), 400
 
-    meeting_dir = os.path.join(MEETINGS_DIR, meeting_id)
-    chunks_dir = os.path.join(meeting_dir, "chunks")
+    chunks_dir = meeting_chunks_dir(meeting_id)
+    ts_str = chunk_timestamp(ts)
+    fname = f"{ts_str}__{user_id}__{uuid.uuid4().hex}.wav"
+    path = os.path.join(chunks_dir, fname)
+    # Save under a hidden temp name and rename, so merges never see a half-written chunk
+    tmp_path = os.path.join(chunks_dir, f".{fname}.part")
+    f.save(tmp_path)
+    os.replace(tmp_path, path)
+
+    # Enqueue STT job to transcribe the audio using Thread Pool
+    try:
+        job_id = register_chunk(meeting_id, user_id, full_name, role, ts_str, path, quality)
+        return jsonify({"status": "queued", "meeting_id": meeting_id, "user_id": user_id, "job_id": job_id}), 202
+    except Exception as e:
+        return jsonify({"status": "error", "meeting_id": meeting_id, "user_id": user_id, "error": str(e)}), 500
+
+
+def meeting_chunks_dir(meeting_id):
+    chunks_dir = os.path.join(MEETINGS_DIR, meeting_id, "chunks")
     os.makedirs(chunks_dir, exist_ok=True)
+    return chunks_dir
 
+
+def chunk_timestamp(ts):
+    """'YYYY-MM-DD HH:MM:SS' -> dd-mm-yyyy_HH-MM-SS của tên file chunk (thiếu/sai thì lấy giờ hiện tại)"""
     if not ts:
         ts_dt = datetime.utcnow()
     else:
@@ -66,19 +96,132 @@ def stt_input():
             ts_dt = datetime.strptime(ts, "%Y-%m-%d %H:%M:%S")
         except ValueError:
             ts_dt = datetime.utcnow()
+    return ts_dt.strftime("%d-%m-%Y_%H-%M-%S")  # dd-mm-yyyy_HH-MM-SS
 
-    ts_str = ts_dt.strftime("%d-%m-%Y_%H-%M-%S")  # dd-mm-yyyy_HH-MM-SS
-    fname = f"{ts_str}__{user_id}__{uuid.uuid4().hex}.wav"
-    path = os.path.join(chunks_dir, fname)
-    f.save(path)
 
-    # Enqueue STT job to transcribe the audio using Thread Pool
+def register_chunk(meeting_id, user_id, full_name, role, ts_str, path, quality=None):
+    """
+    Ghi chunk đã lưu vào index và đưa job STT vào hàng đợi; trả về job_id.
+    quality: tier model (STT_TIERS, vd. "draft" = model nhỏ cho bản nháp nhanh, "final" = model lớn cho biên bản);
+    None = STT_DEFAULT_TIER
+    """
+    record_file(meeting_id, "chunks", path)
+    job_id = enqueue_job("stt", meeting_id, user_id, full_name, role, ts_str, path, tier=quality)
+    set_chunk_status(meeting_id, path, "queued", job_id=job_id)
+    return job_id
+
+
+def ingest_streamed_chunks(meeting_id, user_id, full_name, role, quality=None):
+    """
+    Nhận chunk từ body request, ghi thẳng vào thư mục chunks (không qua file tạm của Flask):
+    - body thô (audio/*): một chunk, ts lấy từ query string
+    - multipart/form-data: nhiều phần "file", mỗi phần một chunk, ts theo thứ tự các trường "ts"
+    """
+    chunks_dir = meeting_chunks_dir(meeting_id)
+
+    if request.mimetype == "multipart/form-data":
+        form, writers = receive_multipart_chunks(request.environ, chunks_dir)
+        if not writers:
+            raise UploadError("missing file")
+        ts_list = form.getlist("ts")
+        paths = []
+        try:
+            for i, writer in enumerate(writers):
+                ts_str = chunk_timestamp(ts_list[i] if i < len(ts_list) else request.args.get("ts"))
+                paths.append((ts_str, writer.commit(ts_str, user_id)))
+        except BaseException:
+            for writer in writers[len(paths):]:
+                writer.discard()
+            for _, path in paths:
+                os.remove(path)
+            raise
+    else:
+        ts_str = chunk_timestamp(request.args.get("ts"))
+        paths = [(ts_str, receive_raw_chunk(request.stream, request.content_length, chunks_dir, ts_str, user_id))]
+
+    chunks = []
+    for ts_str, path in paths:
+        job_id = register_chunk(meeting_id, user_id, full_name, role, ts_str, path, quality)
+        chunks.append({"filename": os.path.basename(path), "ts": ts_str, "job_id": job_id})
+    return chunks
+
+
+@app.route("/api/stt_input_stream", methods=["POST"])
+def stt_input_stream():
+    """
+    Upload chunk dạng stream: meeting_id, user_id, full_name, role, ts, quality trên query string,
+    audio trong body (một chunk thô hoặc multipart nhiều chunk).
+    """
+    meeting_id = request.args.get("meeting_id")
+    user_id = request.args.get("user_id")
+    quality = request.args.get("quality")
+    if not meeting_id or not user_id:
+        return jsonify({"error": "missing meeting_id or user_id"}), 400
+    if quality and quality not in STT_TIERS:
+        return jsonify({"error": f"quality must be one of {sorted(STT_TIERS)}"}), 400
+
     try:
-        enqueue_job("stt", meeting_id, user_id, full_name, role, ts_str, path)
-        return jsonify({"status": "queued", "meeting_id": meeting_id, "user_id": user_id}), 202
+        chunks = ingest_streamed_chunks(meeting_id, user_id, request.args.get("full_name", ""), request.args.get("role", ""),
+                                        quality)
+    except UploadError as e:
+        return jsonify({"status": "error", "error": str(e)}), e.status
+    except RequestEntityTooLarge:
+        return jsonify({"status": "error", "error": "request too large"}), 413
     except Exception as e:
         return jsonify({"status": "error", "meeting_id": meeting_id, "user_id": user_id, "error": str(e)}), 500
 
+    return jsonify({"status": "queued", "meeting_id": meeting_id, "user_id": user_id, "chunks": chunks}), 202
+
+
+@app.route("/api/stt_sessions", methods=["POST"])
+def create_stt_session():
+    """Mở phiên upload cho một người nói; các chunk sau chỉ cần gửi ts"""
+    j = request.get_json() or {}
+    meeting_id = j.get("meeting_id")
+    user_id = j.get("user_id")
+    quality = j.get("quality") or ""
+    if not meeting_id or not user_id:
+        return jsonify({"error": "missing meeting_id or user_id"}), 400
+    if quality and quality not in STT_TIERS:
+        return jsonify({"error": f"quality must be one of {sorted(STT_TIERS)}"}), 400
+
+    session_id = create_upload_session(meeting_id, user_id, j.get("full_name", ""), j.get("role", ""), quality)
+    return jsonify({
+        "session_id": session_id,
+        "meeting_id": meeting_id,
+        "user_id": user_id,
+        "upload_url": url_for('upload_session_chunks', session_id=session_id, _external=True)
+    }), 201
+
+
+@app.route("/api/stt_sessions/<session_id>/chunks", methods=["POST"])
+def upload_session_chunks(session_id):
+    session = get_upload_session(session_id)
+    if session is None:
+        return jsonify({"error": "upload session not found or expired"}), 404
+
+    meeting_id, user_id = session["meeting_id"], session["user_id"]
+    try:
+        chunks = ingest_streamed_chunks(meeting_id, user_id, session["full_name"], session["role"],
+                                        session.get("quality") or None)
+    except UploadError as e:
+        return jsonify({"status": "error", "error": str(e)}), e.status
+    except RequestEntityTooLarge:
+        return jsonify({"status": "error", "error": "request too large"}), 413
+    except Exception as e:
+        return jsonify({"status": "error", "meeting_id": meeting_id, "user_id": user_id, "error": str(e)}), 500
+
+    total = count_session_chunks(session_id, len(chunks))
+    return jsonify({"status": "queued", "session_id": session_id, "meeting_id": meeting_id,
+                    "user_id": user_id, "chunks": chunks, "session_chunks": total}), 202
+
+
+@app.route("/api/stt_sessions/<session_id>", methods=["DELETE"])
+def close_stt_session(session_id):
+    if not close_upload_session(session_id):
+        return jsonify({"error": "upload session not found or expired"}), 404
+    return jsonify({"status": "closed", "session_id": session_id})
+
 
 @app.route("/api/meeting_files/<meeting_id>", methods=["GET"])
 def list_meeting_files(meeting_id):
@@ -87,36 +230,82 @@ def list_meeting_files(meeting_id):
     if file_type not in ["chunks", "final"]:
         return jsonify({"error": "type must be 'chunks' or 'final'"}), 400
     
+    if file_type == "final":
+        # Build/refresh the live transcript DOCX from its segment log if needed
+        ensure_transcript_docx(meeting_id)
+
     meeting_dir = os.path.join(MEETINGS_DIR, meeting_id, file_type)
     if not os.path.exists(meeting_dir):
         return jsonify({"error": f"meeting_id not found or {file_type} folder does not exist"}), 404
 
+    # Bộ lọc: user, khoảng thời gian (from/to), since (cursor = version lần trước), phân trang offset/limit
+    user_filter = request.args.get("user")
+    try:
+        time_from = parse_listing_time(request.args.get("from"))
+        time_to = parse_listing_time(request.args.get("to"))
+        since = int(request.args.get("since", 0))
+        offset = max(0, int(request.args.get("offset", 0)))
+        limit = request.args.get("limit")
+        limit = max(0, int(limit)) if limit is not None else None
+    except ValueError:
+        return jsonify({"error": "from/to must be 'YYYY-MM-DD HH:MM:SS'; since, offset, limit must be integers"}), 400
+
+    # Đối chiếu index với thư mục (rẻ: chunks chỉ quét lại khi thư mục thay đổi)
+    sync_index(meeting_id, file_type)
+    version, entries = list_indexed_files(meeting_id, file_type)
+
+    # Client polling gửi If-None-Match: không có gì thay đổi thì trả 304
+    etag = f"{file_type}-{version}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    if user_filter:
+        entries = [e for e in entries if e.get("user_id") == user_filter]
+    if time_from:
+        entries = [e for e in entries if e["timestamp"] and e["timestamp"] >= time_from]
+    if time_to:
+        entries = [e for e in entries if e["timestamp"] and e["timestamp"] <= time_to]
+    if since:
+        entries = [e for e in entries if e["seq"] > since]
+
+    total = len(entries)
+    page = entries[offset:offset + limit] if limit is not None else entries[offset:]
+
+    endpoint = 'download_meeting_file' if file_type == "chunks" else 'download_merged_file'
     files = []
-    for fname in os.listdir(meeting_dir):
-        fpath = os.path.join(meeting_dir, fname)
-        if os.path.isfile(fpath):
-            try:
-                date_part = fname.split("__")[0]  # dd-mm-yyyy_HH-MM-SS
-                dt = datetime.strptime(date_part, "%d-%m-%Y_%H-%M-%S")
-                date_str = dt.strftime("%d/%m/%Y %H:%M:%S")
-            except Exception:
-                date_str = ""
-            
-            file_size = os.path.getsize(fpath)
-            
-            if file_type == "chunks":
-                file_url = url_for('download_meeting_file', meeting_id=meeting_id, filename=fname, _external=True)
-            else:  # final
-                file_url = url_for('download_merged_file', meeting_id=meeting_id, filename=fname, _external=True)
-            
-            files.append({
-                "filename": fname,
-                "date": date_str,
-                "size": file_size,
-                "url": file_url
-            })
-
-    return jsonify({"meeting_id": meeting_id, "type": file_type, "files": files})
+    for entry in page:
+        item = {
+            "filename": entry["filename"],
+            "date": entry["date"],
+            "size": entry["size"],
+            "url": url_for(endpoint, meeting_id=meeting_id, filename=entry["filename"], _external=True),
+            "user_id": entry.get("user_id"),
+            "duration": entry.get("duration"),
+            "seq": entry["seq"],
+        }
+        if file_type == "chunks":
+            item["transcript"] = entry.get("transcript")
+        files.append(item)
+
+    response = jsonify({
+        "meeting_id": meeting_id,
+        "type": file_type,
+        "files": files,
+        "total": total,
+        "offset": offset,
+        "version": version
+    })
+    response.set_etag(etag)
+    return response
+
+
+def parse_listing_time(value):
+    """'YYYY-MM-DD HH:MM:SS' (cùng định dạng ts của stt_input) -> ISO string so sánh được với index"""
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").isoformat()
 
 
 @app.route("/api/meeting_files/<meeting_id>/<filename>", methods=["GET"])
@@ -129,6 +318,7 @@ def download_meeting_file(meeting_id, filename):
 
 @app.route("/api/merged_file/<meeting_id>/<filename>", methods=["GET"])
 def download_merged_file(meeting_id, filename):
+    ensure_transcript_docx(meeting_id)
     meeting_dir = os.path.join(MEETINGS_DIR, meeting_id, "final")
     if not os.path.exists(os.path.join(meeting_dir, filename)):
         return jsonify({"error": "file not found"}), 404
@@ -150,30 +340,85 @@ def merge_audio():
 
     # Enqueue merge job to run in background using Thread Pool
     try:
-        enqueue_job("merge_audio", meeting_id)
-        return jsonify({"status": "merge_queued", "meeting_id": meeting_id}), 202
+        job_id = enqueue_job("merge_audio", meeting_id)
+        return jsonify({
+            "status": "merge_queued",
+            "meeting_id": meeting_id,
+            "job_id": job_id,
+            "check_status_url": url_for('check_merge_status', job_id=job_id, _external=True)
+        }), 202
     except Exception as e:
         return jsonify({"status": "error", "meeting_id": meeting_id, "error": str(e)}), 500
 
 
 @app.route("/api/merge_status/<job_id>", methods=["GET"])
+@app.route("/api/job_status/<job_id>", methods=["GET"])
 def check_merge_status(job_id):
-    return jsonify({"error": "merge status checking is not available with Thread Pool"}), 501
+    """Status of any queued job (stt or merge_audio): queued, running, done or failed"""
+    try:
+        status = get_job_status(job_id)
+    except Exception as e:
+        return jsonify({"error": "failed to read job status", "details": str(e)}), 500
+    if status is None:
+        return jsonify({"error": "job not found", "job_id": job_id}), 404
+    return jsonify(status)
 
 
 @app.route("/api/transcript_file/<meeting_id>/<filename>", methods=["GET"])
 def download_transcript_file(meeting_id, filename):
     """Download transcript DOCX file"""
+    ensure_transcript_docx(meeting_id)
     meeting_dir = os.path.join(MEETINGS_DIR, meeting_id, "final")
     if not os.path.exists(os.path.join(meeting_dir, filename)):
         return jsonify({"error": "file not found"}), 404
     return send_from_directory(meeting_dir, filename, as_attachment=True)
 
 
+@app.route("/api/transcript_stream/<meeting_id>", methods=["GET"])
+def transcript_stream(meeting_id):
+    """
+    Server-Sent Events: đẩy từng đoạn transcript ngay khi STT xong (event "segment").
+    id của mỗi event là số thứ tự trong Redis stream; client nối lại bằng header
+    Last-Event-ID (EventSource tự gửi) hoặc ?last_id=. last_id=$ = chỉ nhận đoạn mới.
+    Mỗi worker giữ tối đa SSE_MAX_STREAMS stream; vượt quá thì trả 503 + Retry-After.
+    """
+    if not os.path.isdir(os.path.join(MEETINGS_DIR, meeting_id)):
+        return jsonify({"error": "meeting_id not found"}), 404
+
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_id") or "0-0"
+    if last_id == "$":
+        last_id = latest_transcript_event_id(meeting_id)
+    elif not re.fullmatch(r"\d+(-\d+)?", last_id):
+        return jsonify({"error": "invalid last_id"}), 400
+
+    if not _sse_slots.acquire(blocking=False):
+        return jsonify({"error": "too many open transcript streams, retry later"}), 503, {"Retry-After": str(SSE_HEARTBEAT_SECONDS)}
+
+    def generate():
+        cursor = last_id
+        deadline = time.monotonic() + SSE_MAX_SECONDS
+        yield "retry: 3000\n\n"
+        while time.monotonic() < deadline:
+            events = read_transcript_stream(meeting_id, cursor, block_ms=SSE_HEARTBEAT_SECONDS * 1000)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event_id, segment in events:
+                cursor = event_id
+                yield f"id: {event_id}\nevent: segment\ndata: {json.dumps(segment, ensure_ascii=False)}\n\n"
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # Runs when the server closes the response, even if the client left before the first event
+    response.call_on_close(_sse_slots.release)
+    return response
+
+
 @app.route("/api/convert_pdf", methods=["POST"])
 def convert_pdf():
     """
-    API to convert a DOCX file of a meeting to a signed PDF file.
+    API to convert a DOCX file of a meeting to a PDF file.
+    Returns a job handle at once; poll /api/job_status/<job_id> for the result.
     """
     j = request.get_json() or {}
     meeting_id = j.get("meeting_id")
@@ -181,6 +426,7 @@ def convert_pdf():
     if not meeting_id:
         return jsonify({"error": "missing meeting_id"}), 400
 
+    ensure_transcript_docx(meeting_id)
     meeting_dir = os.path.join(MEETINGS_DIR, meeting_id, "final")
     if not os.path.exists(meeting_dir):
         return jsonify({"error": "meeting directory not found"}), 404
@@ -193,15 +439,22 @@ def convert_pdf():
     docx_path = os.path.join(meeting_dir, docx_files[0])
     pdf_path = os.path.join(meeting_dir, os.path.splitext(docx_files[0])[0] + ".pdf")
 
+    # Same DOCX content as the last conversion: return the cached PDF at once
+    if get_cached_artifact(meeting_dir, f"pdf:{docx_files[0]}", pdf_artifact_key(docx_path)):
+        return jsonify({"status": "cached", "meeting_id": meeting_id, "pdf_path": pdf_path}), 200
+
+    # Convert in the background on a warm LibreOffice instance (see pdf_service)
     try:
-        # Convert DOCX to PDF
-        success = try_convert_docx_to_pdf_libreoffice(docx_path, pdf_path)
-        if not success:
-            return jsonify({"error": "failed to convert DOCX to PDF"}), 500
-        
-        return jsonify({"message": "DOCX converted to PDF successfully", "pdf_path": pdf_path}), 200
+        job_id = enqueue_job("convert_pdf", meeting_id, docx_path, pdf_path)
+        return jsonify({
+            "status": "convert_queued",
+            "meeting_id": meeting_id,
+            "job_id": job_id,
+            "pdf_path": pdf_path,
+            "check_status_url": url_for('check_merge_status', job_id=job_id, _external=True)
+        }), 202
     except Exception as e:
-        return jsonify({"error": "failed to convert PDF", "details": str(e)}), 500
+        return jsonify({"error": "failed to queue PDF conversion", "details": str(e)}), 500
 
 
 
@@ -216,38 +469,42 @@ def create_key():
         if not user_id or not user_name:
             return jsonify({"error": "user_id và user_name là bắt buộc"}), 400
 
-        # Kiểm tra xem file PFX đã tồn tại hay chưa
-        pfx_path = f"keys/{user_id}-{user_name}.pfx"
-        if os.path.exists(pfx_path):
-            return jsonify({"message": "Key đã tồn tại", "key": pfx_path}), 200
-
-        # 1. Tạo Private Key
-        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
-
-        # 2. Tạo Certificate tự ký
-        sign_text = user_id + user_name
-        subject = issuer = x509.Name([
-            x509.NameAttribute(NameOID.COMMON_NAME, sign_text),
-        ])
-        cert = (
-            x509.CertificateBuilder()
-            .subject_name(subject)
-            .issuer_name(issuer)
-            .public_key(key.public_key())
-            .serial_number(x509.random_serial_number())
-            .not_valid_before(datetime.now(timezone.utc))
-            .not_valid_after(datetime.now(timezone.utc) + timedelta(days=10))
-            .sign(key, hashes.SHA256())
-        )
-
-        # 3. Lưu thành file .pfx (PKCS#12)
-        with open(f"keys/{user_id}-{user_name}.pfx", "wb") as f:
-            # SỬA DÒNG NÀY: Dùng trực tiếp pkcs12.serialize... thay vì serialization.pkcs12...
-            f.write(pkcs12.serialize_key_and_certificates(
-                f"{user_id}-{user_name}".encode(), key, cert, None, serialization.BestAvailableEncryption(f"actvn@edu.vn{user_id}-{user_name}".encode())
-            ))
-
-        return jsonify({"message": "Tạo key thành công", "key": f"{user_id}-{user_name}.pfx"}), 200
+        # Sinh key trong process pool (hoặc lấy key sinh sẵn), không chiếm worker gunicorn
+        result = provision_keys([(user_id, user_name)])[0]
+        if result["status"] == "exists":
+            return jsonify({"message": "Key đã tồn tại", "key": result["key"]}), 200
+
+        return jsonify({"message": "Tạo key thành công", "key": result["key"]}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/create_keys', methods=['POST'])
+def create_keys():
+    """Tạo key hàng loạt: {"users": [{"user_id": ..., "user_name": ...}, ...]}"""
+    try:
+        data = request.get_json() or {}
+        users = data.get('users')
+
+        if not isinstance(users, list) or not users:
+            return jsonify({"error": "users phải là danh sách không rỗng"}), 400
+        if len(users) > MAX_KEYS_PER_REQUEST:
+            return jsonify({"error": f"Tối đa {MAX_KEYS_PER_REQUEST} user mỗi lần"}), 400
+
+        pairs = []
+        for user in users:
+            user_id = user.get('user_id') if isinstance(user, dict) else None
+            user_name = user.get('user_name') if isinstance(user, dict) else None
+            if not user_id or not user_name:
+                return jsonify({"error": "Mỗi user cần có user_id và user_name"}), 400
+            pairs.append((user_id, user_name))
+
+        results = provision_keys(pairs)
+        created = sum(1 for result in results if result["status"] == "created")
+        return jsonify({
+            "message": f"Đã tạo {created} key, {len(results) - created} key đã tồn tại",
+            "results": results
+        }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
@@ -282,8 +539,8 @@ def sign_pdf():
         if not os.path.exists(pfx_file):
             return jsonify({"error": f"File {pfx_file} không tồn tại"}), 404
 
-        # 1. Load Signer
-        signer = signers.SimpleSigner.load_pkcs12(pfx_file=pfx_file, passphrase=passphrase.encode())
+        # 1. Load Signer (từ cache, chỉ giải mã file PFX khi cache miss/hết hạn)
+        signer = signer_cache.get(pfx_file, passphrase)
 
         # 2. Mở file PDF
         with open(input_pdf, 'rb') as inf:
@@ -323,66 +580,166 @@ def sign_pdf():
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/sign_pdf_batch', methods=['POST'])
+def sign_pdf_batch_api():
+    """
+    Ký nhiều chữ ký lên PDF của cuộc họp trong một request.
+    Body: {"meeting_id": "...", "signers": [{"user_id": "...", "user_name": "..."}, ...]}
+    Mỗi chữ ký là một incremental update trên bản trong bộ nhớ, file chỉ đọc/ghi một lần.
+    """
+    try:
+        data = request.get_json() or {}
+        meeting_id = data.get('meeting_id')
+        signer_list = data.get('signers') or []
+
+        if not meeting_id or not isinstance(signer_list, list) or not signer_list:
+            return jsonify({"error": "Các tham số meeting_id, signers là bắt buộc"}), 400
+
+        users = []
+        for item in signer_list:
+            user_id, user_name = (item or {}).get('user_id'), (item or {}).get('user_name')
+            if not user_id or not user_name:
+                return jsonify({"error": "Mỗi signer cần user_id và user_name"}), 400
+            if not os.path.exists(pfx_path_for(user_id, user_name)):
+                return jsonify({"error": f"File {pfx_path_for(user_id, user_name)} không tồn tại"}), 404
+            users.append((user_id, user_name))
+
+        if len({user_id for user_id, _ in users}) != len(users):
+            return jsonify({"error": "Mỗi user_id chỉ được ký một lần"}), 400
+
+        pdf_files = glob.glob(os.path.join('meetings', meeting_id, 'final', '*.pdf'))
+        if not pdf_files:
+            return jsonify({"error": f"Không tìm thấy file PDF nào trong thư mục meetings/{meeting_id}/final"}), 404
+
+        input_pdf = pdf_files[0]
+        timestamp = datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")
+        output_pdf = os.path.join('meetings', meeting_id, 'final', f'signed_batch_{timestamp}.pdf')
+
+        with open(input_pdf, 'rb') as inf:
+            pdf_bytes = inf.read()
+
+        signed = sign_pdf_batch(pdf_bytes, users)
+
+        tmp_pdf = output_pdf + '.tmp'
+        with open(tmp_pdf, 'wb') as outf:
+            outf.write(signed)
+        os.replace(tmp_pdf, output_pdf)
+
+        # Sau khi xuất ra file đã ký, xóa file PDF cũ
+        if os.path.exists(input_pdf) and input_pdf != output_pdf:
+            os.remove(input_pdf)
+
+        return jsonify({
+            "message": "Đã ký file thành công",
+            "output_pdf": output_pdf,
+            "signed_by": [f"{user_id}-{user_name}" for user_id, user_name in users]
+        }), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/signer_cache/evict', methods=['POST'])
+def evict_signer_cache():
+    """Xóa signer đã cache của một user (khi đổi key), hoặc toàn bộ nếu không truyền user"""
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('user_id')
+    user_name = data.get('user_name')
+    if user_id and user_name:
+        evicted = signer_cache.evict(pfx_path_for(user_id, user_name))
+    else:
+        evicted = signer_cache.evict()
+    return jsonify({"evicted": evicted}), 200
     
 
 @app.route("/api/get_document", methods=["POST"])
 def get_document():
+    """
+    Đọc biên bản. Không có "since": toàn bộ nội dung (content) kèm version.
+    Có "since": chỉ các đoạn (paragraph) thay đổi sau version đó, gồm cả đoạn đã xoá (deleted).
+    """
     data = request.get_json() or {}
     meeting_id = data.get("meeting_id")
     user_id = data.get("user_id")
+    since = data.get("since")
 
     if not meeting_id or not user_id:
         return jsonify({"error": "missing meeting_id or user_id"}), 400
+    if since is not None and not isinstance(since, int):
+        return jsonify({"error": "since must be an integer version"}), 400
 
-    meeting_dir = os.path.join(MEETINGS_DIR, meeting_id, "final")
-    if not os.path.exists(meeting_dir):
-        return jsonify({"error": "meeting_id not found or final folder does not exist"}), 404
-
-    # Find the first .docx file in the final directory
-    docx_files = [f for f in os.listdir(meeting_dir) if f.endswith(".docx")]
-    if not docx_files:
-        return jsonify({"error": "no .docx file found in final folder"}), 404
-
-    docx_path = os.path.join(meeting_dir, docx_files[0])
     try:
-        # Read content from the .docx file
-        document = Document(docx_path)
-        content = "\n".join([paragraph.text for paragraph in document.paragraphs])
-        return jsonify({"meeting_id": meeting_id, "user_id": user_id, "content": content})
+        if since is None:
+            result = document_store.get_text(meeting_id)
+            if result is None:
+                return jsonify({"error": "meeting_id not found"}), 404
+            version, content = result
+            return jsonify({"meeting_id": meeting_id, "user_id": user_id, "version": version, "content": content})
+
+        result = document_store.get_paragraphs(meeting_id, since)
+        if result is None:
+            return jsonify({"error": "meeting_id not found"}), 404
+        version, paragraphs = result
+        return jsonify({"meeting_id": meeting_id, "user_id": user_id, "version": version,
+                        "since": since, "paragraphs": paragraphs})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/api/push_document", methods=["POST"])
 def push_document():
+    """
+    Lưu biên bản.
+    - "ops": danh sách thao tác theo đoạn (update / insert / delete), mỗi thao tác kèm version
+      của đoạn mà client đã sửa; đoạn đã bị người khác sửa sau đó -> 409.
+    - "content": lưu cả văn bản như trước; chỉ các đoạn khác biệt được ghi. Có "base_version" thì
+      kiểm tra xung đột theo version đó.
+    DOCX chỉ được ghi lại khi cần tải file / chuyển PDF.
+    """
     data = request.get_json() or {}
     meeting_id = data.get("meeting_id")
     user_id = data.get("user_id")
     content = data.get("content")
+    ops = data.get("ops")
+    base_version = data.get("base_version")
 
-    if not meeting_id or not user_id or not content:
-        return jsonify({"error": "missing meeting_id, user_id, or content"}), 400
+    if not meeting_id or not user_id or (not content and not ops):
+        return jsonify({"error": "missing meeting_id, user_id, or content/ops"}), 400
+    if ops is not None and (not isinstance(ops, list) or not all(isinstance(op, dict) for op in ops)):
+        return jsonify({"error": "ops must be a list of objects"}), 400
+    if not os.path.isdir(os.path.join(MEETINGS_DIR, meeting_id)):
+        return jsonify({"error": "meeting_id not found"}), 404
 
-    meeting_dir = os.path.join("meetings", meeting_id, "final")
-    if not os.path.exists(meeting_dir):
-        return jsonify({"error": "meeting_id not found or final folder does not exist"}), 404
+    try:
+        if ops:
+            version = document_store.apply_patch(meeting_id, ops, base_version)
+        else:
+            version = document_store.replace_text(meeting_id, content, base_version)
+        return jsonify({"status": "success", "meeting_id": meeting_id, "user_id": user_id, "version": version})
+    except document_store.DocumentConflict as e:
+        return jsonify({"error": "conflict", "details": str(e), "version": e.version,
+                        "paragraph_ids": e.paragraph_ids}), 409
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": "invalid operation", "details": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-    # Find the first .docx file in the final directory
-    docx_files = [f for f in os.listdir(meeting_dir) if f.endswith(".docx")]
-    if not docx_files:
-        return jsonify({"error": "no .docx file found in final folder"}), 404
 
-    docx_path = os.path.join(meeting_dir, docx_files[0])
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus metrics của web tier và STT service (multiprocess), kèm độ dài hàng đợi Redis"""
+    queues = [(lane, shard, queue_key(lane, shard), processing_key(queue_key(lane, shard)))
+              for lane, count in LANE_WORKERS.items() for shard in range(count)]
     try:
-        # Update content in the existing .docx file
-        document = Document(docx_path)
-        document._body.clear_content()  # Clear existing content
-        for line in content.split("\n"):
-            document.add_paragraph(line)
-        document.save(docx_path)
-        return jsonify({"status": "success", "meeting_id": meeting_id, "user_id": user_id})
+        rendered = metrics.render(redis_client, queues)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return jsonify({"error": "failed to collect metrics", "details": str(e)}), 500
+    if rendered is None:
+        return jsonify({"error": "prometheus_client is not installed"}), 501
+    body, content_type = rendered
+    return Response(body, mimetype=None, content_type=content_type)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Canonical decoded form of uploaded chunks, shared by STT and the merges.
+
+Every chunk used to be decoded by ffmpeg at least twice: once by whisper's
+load_audio inside the STT job and once more by pydub in every merge. Now the
+first consumer decodes it once to 16 kHz mono s16 PCM and stores it as a .npy
+array in meetings/<id>/pcm/<chunk file>.npy; later readers np.load it with
+mmap_mode="r", which costs no decode and no copy.
+
+- The STT worker normally creates the file (jobs.JobWorker.load_speech);
+  a merge that runs first creates it itself, so nothing depends on job order.
+- Writes go through a temp file + rename, so concurrent consumers at worst
+  decode twice and never read half a file. A cache file older than its chunk
+  is rebuilt.
+- 16 kHz 16-bit WAVs (what the recorder sends) are read directly from their
+  data section, without starting ffmpeg at all.
+"""
+import os
+import subprocess
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+PCM_DIR = "pcm"
+
+
+def pcm_path(chunk_path):
+    """meetings/<id>/chunks/<name> -> meetings/<id>/pcm/<name>.npy"""
+    chunks_dir, name = os.path.split(os.path.abspath(chunk_path))
+    return os.path.join(os.path.dirname(chunks_dir), PCM_DIR, name + ".npy")
+
+
+def _read_wav_16k(chunk_path):
+    """
+    int16 samples of a 16 kHz 16-bit PCM WAV (channels averaged), or None if the
+    file needs ffmpeg. The header is parsed by utils.read_wav_layout, so streamed
+    WAVs with a 0/0xFFFFFFFF data size are read up to the end of the file.
+    """
+    from utils import read_wav_layout
+
+    try:
+        (channels, sample_width, frame_rate), data_offset, data_size = read_wav_layout(chunk_path)
+    except (OSError, ValueError):
+        return None
+    if frame_rate != SAMPLE_RATE or sample_width != 2 or not data_size:
+        return None
+    samples = np.fromfile(chunk_path, dtype="<i2", count=data_size // 2, offset=data_offset)
+    if channels > 1:
+        samples = samples[: len(samples) // channels * channels].reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples
+
+
+def _ffmpeg_decode(chunk_path):
+    """Decode any format to 16 kHz mono s16 with one ffmpeg call (same resampling as whisper.load_audio)"""
+    from pydub import AudioSegment
+
+    cmd = [
+        AudioSegment.converter, "-nostdin", "-loglevel", "error", "-threads", "0", "-i", chunk_path,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "-",
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {chunk_path}: {proc.stderr.decode('utf-8', 'replace').strip()}")
+    return np.frombuffer(proc.stdout, dtype=np.int16)
+
+
+def ensure_pcm(chunk_path):
+    """Decode the chunk to its .npy cache file unless an up-to-date one exists; returns the cache path"""
+    path = pcm_path(chunk_path)
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(chunk_path):
+            return path
+    except OSError:
+        pass
+
+    samples = _read_wav_16k(chunk_path)
+    if samples is None:
+        samples = _ffmpeg_decode(chunk_path)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, samples)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_pcm(chunk_path):
+    """16 kHz mono int16 samples of a chunk, memory-mapped from the cache (decoded on first use)"""
+    return np.load(ensure_pcm(chunk_path), mmap_mode="r")
+
+
+def load_audio(chunk_path):
+    """Chunk as 16 kHz mono float32 in [-1, 1), the input format of the STT backends and VAD"""
+    return load_pcm(chunk_path).astype(np.float32) / 32768.0
+
+
+def load_segment(chunk_path):
+    """Chunk as a pydub AudioSegment (16 kHz mono 16-bit) for the merges, without an ffmpeg call"""
+    from pydub import AudioSegment
+
+    return AudioSegment(data=load_pcm(chunk_path).tobytes(), sample_width=2, frame_rate=SAMPLE_RATE, channels=1)
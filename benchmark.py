@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end pipeline benchmark with synthetic meetings.
+
+Generates meetings in the layout stt_input writes
+(meetings/<id>/chunks/dd-mm-yyyy_HH-MM-SS__<user>__<uuid>.wav), with many
+speakers and chunks of varying length, then times each pipeline stage against
+local stand-ins: fakeredis instead of Redis (or a real server with
+--redis-url) and a synthetic STT backend instead of Whisper.
+
+Every scenario runs in a fresh process, so its peak RSS is its own. The
+report is JSON (stdout or --output) to compare across commits:
+
+    python benchmark.py --meetings 4 --speakers 6 --chunks 60 --output bench.json
+
+Scenarios:
+    stt                  queued STT jobs through a JobWorker (VAD + synthetic backend)
+    transcript_cache     append_transcript_cache, one call per segment
+    append_to_docx       append_to_docx, one call per segment (open + save every time)
+    transcript_docx      append_transcript_segment + ensure_transcript_docx per segment
+    merge_wav            merge_audio_chunks (WAV concatenation)
+    merge_direct         merge_audio_chunks_direct          (needs ffmpeg)
+    merge_incremental    merge_audio_chunks_incremental     (needs ffmpeg)
+    merge_streaming      merge_audio_chunks_streaming       (needs ffmpeg)
+    pdf                  pdf_service.convert_docx_to_pdf    (needs LibreOffice)
+
+Scenarios whose external tool is missing are reported as skipped.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+SCENARIOS = ("stt", "transcript_cache", "append_to_docx", "transcript_docx",
+             "merge_wav", "merge_direct", "merge_incremental", "merge_streaming", "pdf")
+
+
+# ---------------------------------------------------------------- synthetic data
+
+def synth_speech(rng, seconds):
+    """Speech-like int16 audio: voiced bursts of harmonics separated by near-silent pauses"""
+    n = int(seconds * SAMPLE_RATE)
+    audio = np.zeros(n, dtype=np.float32)
+    pos = 0
+    while pos < n:
+        burst = int(rng.uniform(0.3, 1.5) * SAMPLE_RATE)
+        t = np.arange(min(burst, n - pos), dtype=np.float32) / SAMPLE_RATE
+        f0 = rng.uniform(90, 250)
+        tone = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 5))
+        audio[pos:pos + len(t)] = 0.3 * tone * np.hanning(len(t))
+        pos += len(t) + int(rng.uniform(0.1, 0.6) * SAMPLE_RATE)
+    audio += np.random.default_rng(rng.randrange(2 ** 32)).normal(0, 0.003, n).astype(np.float32)
+    return (np.clip(audio, -1, 1) * 32767).astype(np.int16)
+
+
+def write_wav(path, samples):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(samples.tobytes())
+
+
+def generate_meetings(meetings_dir, args):
+    """Write the synthetic chunk files; returns {meeting_id: [chunk metadata, ...]}"""
+    rng = random.Random(args.seed)
+    start = datetime(2025, 1, 6, 9, 0, 0)
+    # Per-run meeting ids, so runs against a shared --redis-url never see each other's keys
+    run_tag = uuid.uuid4().hex[:8]
+    meetings = {}
+    for m in range(args.meetings):
+        meeting_id = f"bench-{run_tag}-{m}"
+        chunks_dir = os.path.join(meetings_dir, meeting_id, "chunks")
+        os.makedirs(chunks_dir, exist_ok=True)
+        users = [f"user{u}" for u in range(args.speakers)]
+        ts = start + timedelta(hours=m)
+        chunks = []
+        for _ in range(args.chunks):
+            seconds = rng.uniform(args.min_seconds, args.max_seconds)
+            user = rng.choice(users)
+            ts_str = ts.strftime("%d-%m-%Y_%H-%M-%S")
+            fname = f"{ts_str}__{user}__{uuid.UUID(int=rng.getrandbits(128)).hex}.wav"
+            write_wav(os.path.join(chunks_dir, fname), synth_speech(rng, seconds))
+            chunks.append({"file": fname, "user_id": user, "ts": ts_str, "seconds": seconds})
+            ts += timedelta(seconds=max(1, int(seconds)))
+        meetings[meeting_id] = chunks
+    return meetings
+
+
+def transcript_entries(chunks):
+    return [{
+        "ts": c["ts"],
+        "user_id": c["user_id"],
+        "full_name": c["user_id"].title(),
+        "role": "participant",
+        "text": f"Synthetic transcript of {c['seconds']:.1f} seconds of speech " * 3,
+        "source_file": c["file"],
+    } for c in chunks]
+
+
+# ---------------------------------------------------------------- stand-ins
+
+def use_fake_redis():
+    """Point every Redis.from_url client (utils.r, ...) at one in-process fakeredis server"""
+    import fakeredis
+    import redis
+
+    server = fakeredis.FakeServer()
+    redis.Redis.from_url = classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server))
+
+
+def make_synthetic_backend(rtf):
+    """STT backend stand-in: decodes WAV itself and 'transcribes' at rtf x real time"""
+    from stt_backends import SttBackend
+
+    class SyntheticBackend(SttBackend):
+        name = "synthetic"
+
+        def load_audio(self, filepath):
+            with wave.open(filepath, "rb") as w:
+                frames = w.readframes(w.getnframes())
+            return np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
+
+        def transcribe(self, audio):
+            if isinstance(audio, str):
+                audio = self.load_audio(audio)
+            if rtf:
+                time.sleep(len(audio) / SAMPLE_RATE * rtf)
+            return f" synthetic text for {len(audio) / SAMPLE_RATE:.2f} s"
+
+    return SyntheticBackend("synthetic")
+
+
+# ---------------------------------------------------------------- measurement
+
+def percentile(values, q):
+    if not values:
+        return None
+    # nearest-rank
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100.0 * len(ordered)) - 1)]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(latencies, wall_seconds, audio_seconds=None, **extra):
+    ms = [x * 1000 for x in latencies]
+    result = {
+        "ops": len(latencies),
+        "wall_seconds": round(wall_seconds, 4),
+        "throughput_per_s": round(len(latencies) / wall_seconds, 3) if wall_seconds else None,
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else None,
+        "p50_ms": round(percentile(ms, 50), 3) if ms else None,
+        "p99_ms": round(percentile(ms, 99), 3) if ms else None,
+        "max_ms": round(max(ms), 3) if ms else None,
+    }
+    if audio_seconds is not None:
+        result["audio_seconds"] = round(audio_seconds, 2)
+        result["realtime_factor"] = round(audio_seconds / wall_seconds, 2) if wall_seconds else None
+    result.update(extra)
+    return result
+
+
+def timed_calls(calls):
+    """Run callables in order; returns (latencies, wall seconds)"""
+    latencies = []
+    started = time.perf_counter()
+    for call in calls:
+        t0 = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - started
+
+
+# ---------------------------------------------------------------- scenarios
+
+def bench_stt(meetings, args):
+    import jobs
+
+    from stt_backends import registry, model_for_tier
+    registry.add(model_for_tier(None), make_synthetic_backend(args.stt_rtf))
+    job_ids = []
+    for meeting_id, chunks in meetings.items():
+        for c in chunks:
+            path = os.path.join(jobs.MEETINGS_DIR, meeting_id, "chunks", c["file"])
+            job_ids.append(jobs.enqueue_job("stt", meeting_id, c["user_id"], c["user_id"].title(), "participant", c["ts"], path))
+
+    workers = [jobs.JobWorker(lane="stt", shard=shard) for shard in range(jobs.STT_WORKERS)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    pending = set(job_ids)
+    while pending:
+        time.sleep(0.02)
+        pending = {j for j in pending if jobs.get_job_status(j)["state"] not in ("done", "failed")}
+    wall = time.perf_counter() - started
+    for worker in workers:
+        worker.stop()
+
+    latencies, failed = [], 0
+    for job_id in job_ids:
+        status = jobs.get_job_status(job_id)
+        failed += status["state"] == "failed"
+        end = status.get("done_at") or status.get("failed_at")
+        latencies.append((datetime.fromisoformat(end) - datetime.fromisoformat(status["running_at"])).total_seconds())
+    audio = sum(c["seconds"] for chunks in meetings.values() for c in chunks)
+    return summarize(latencies, wall, audio, failed=failed, batch_size=jobs.STT_BATCH_SIZE,
+                     note="latency = running -> done per job; jobs of one batch share it")
+
+
+def bench_transcript_cache(meetings, args):
+    import utils
+
+    calls = [lambda m=m, e=e: utils.append_transcript_cache(m, e)
+             for m, chunks in meetings.items() for e in transcript_entries(chunks)]
+    latencies, wall = timed_calls(calls)
+    cached = sum(utils.r.llen(f"meeting:{m}:transcripts") for m in meetings)
+    return summarize(latencies, wall, cached_entries=cached)
+
+
+def bench_append_to_docx(meetings, args):
+    import utils
+
+    calls = [lambda m=m, e=e: utils.append_to_docx(m, e)
+             for m, chunks in meetings.items() for e in transcript_entries(chunks)]
+    return summarize(*timed_calls(calls))
+
+
+def bench_transcript_docx(meetings, args):
+    import utils
+
+    def step(meeting_id, entry):
+        utils.append_transcript_segment(meeting_id, entry)
+        utils.ensure_transcript_docx(meeting_id)
+
+    calls = [lambda m=m, e=e: step(m, e) for m, chunks in meetings.items() for e in transcript_entries(chunks)]
+    return summarize(*timed_calls(calls))
+
+
+def bench_merge(function_name):
+    def run(meetings, args):
+        import utils
+
+        merge = getattr(utils, function_name)
+        final_dirs = {m: os.path.join(utils.MEETINGS_DIR, m, "final") for m in meetings}
+        for d in final_dirs.values():
+            os.makedirs(d, exist_ok=True)
+        ext = "wav" if function_name == "merge_audio_chunks" else "ogg"
+        calls = [lambda m=m: merge(os.path.join(utils.MEETINGS_DIR, m, "chunks"), os.path.join(final_dirs[m], f"merged.{ext}"))
+                 for m in meetings]
+        latencies, wall = timed_calls(calls)
+        audio = sum(c["seconds"] for chunks in meetings.values() for c in chunks)
+        return summarize(latencies, wall, audio, chunks_per_meeting=args.chunks)
+    return run
+
+
+def bench_pdf(meetings, args):
+    import pdf_service
+    import utils
+
+    docx_paths = {}
+    for meeting_id, chunks in meetings.items():
+        for entry in transcript_entries(chunks):
+            utils.append_transcript_segment(meeting_id, entry)
+        docx_paths[meeting_id] = utils.ensure_transcript_docx(meeting_id)
+    try:
+        calls = [lambda d=d: pdf_service.convert_docx_to_pdf(d, d[:-5] + ".pdf") for d in docx_paths.values()]
+        latencies, wall = timed_calls(calls)
+    finally:
+        pdf_service.shutdown()
+    # The first conversion includes starting the warm instance
+    return summarize(latencies, wall, first_ms=round(latencies[0] * 1000, 3))
+
+
+SCENARIO_FUNCTIONS = {
+    "stt": bench_stt,
+    "transcript_cache": bench_transcript_cache,
+    "append_to_docx": bench_append_to_docx,
+    "transcript_docx": bench_transcript_docx,
+    "merge_wav": bench_merge("merge_audio_chunks"),
+    "merge_direct": bench_merge("merge_audio_chunks_direct"),
+    "merge_incremental": bench_merge("merge_audio_chunks_incremental"),
+    "merge_streaming": bench_merge("merge_audio_chunks_streaming"),
+    "pdf": bench_pdf,
+}
+
+
+def missing_requirement(name):
+    if name.startswith("merge_") and name != "merge_wav" and not shutil.which("ffmpeg"):
+        return "ffmpeg not found"
+    if name == "pdf" and not shutil.which(os.getenv("SOFFICE_BIN", "soffice")):
+        return "LibreOffice (soffice) not found"
+    return None
+
+
+def run_scenario(name, workdir, meetings, args):
+    """Entry point of the per-scenario process: fresh copy of the meetings, fresh Redis"""
+    meetings_dir = os.path.join(workdir, f"run_{name}")
+    shutil.copytree(os.path.join(workdir, "meetings"), meetings_dir)
+    os.environ["MEETINGS_DIR"] = meetings_dir
+    if args.redis_url:
+        os.environ["REDIS_URL"] = args.redis_url
+    else:
+        use_fake_redis()
+
+    import logging
+    import warnings
+    logging.disable(logging.WARNING)
+    warnings.filterwarnings("ignore", module="pydub")  # "Couldn't find ffmpeg" on import
+    baseline = peak_rss_mb()
+    # The pipeline prints progress; keep stdout for the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = SCENARIO_FUNCTIONS[name](meetings, args)
+    result["peak_rss_mb"] = peak_rss_mb()
+    result["baseline_rss_mb"] = baseline
+    shutil.rmtree(meetings_dir, ignore_errors=True)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--meetings", type=int, default=2)
+    parser.add_argument("--speakers", type=int, default=5)
+    parser.add_argument("--chunks", type=int, default=40, help="chunks per meeting")
+    parser.add_argument("--min-seconds", type=float, default=1.0)
+    parser.add_argument("--max-seconds", type=float, default=8.0)
+    parser.add_argument("--stt-rtf", type=float, default=0.0,
+                        help="synthetic STT cost as a fraction of audio duration (0 = pipeline overhead only)")
+    parser.add_argument("--scenarios", default="all", help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--redis-url", help="benchmark against a real Redis instead of fakeredis (meeting ids are unique per run)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--workdir", help="keep generated meetings in this directory")
+    args = parser.parse_args(argv)
+
+    names = list(SCENARIOS) if args.scenarios == "all" else [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [n for n in names if n not in SCENARIO_FUNCTIONS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="whisper_bench_")
+    try:
+        t0 = time.perf_counter()
+        meetings = generate_meetings(os.path.join(workdir, "meetings"), args)
+        generation_seconds = time.perf_counter() - t0
+
+        results = {}
+        ctx = multiprocessing.get_context("spawn")
+        for name in names:
+            reason = missing_requirement(name)
+            if reason:
+                results[name] = {"skipped": reason}
+                continue
+            print(f"running {name}...", file=sys.stderr)
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                try:
+                    results[name] = pool.submit(run_scenario, name, workdir, meetings, args).result()
+                except Exception as e:
+                    results[name] = {"error": f"{type(e).__name__}: {e}"}
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "workdir")},
+        "dataset": {
+            "meetings": len(meetings),
+            "chunks": sum(len(c) for c in meetings.values()),
+            "audio_seconds": round(sum(x["seconds"] for c in meetings.values() for x in c), 2),
+            "generation_seconds": round(generation_seconds, 3),
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
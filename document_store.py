@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+Versioned, paragraph-level store of a meeting's editable transcript document.
+
+get_document used to re-parse the whole DOCX and push_document rewrote it for
+every save, so concurrent editors clobbered each other. The document is now
+kept in meetings/<id>/document.json:
+
+    {"version": 12, "docx_version": 10, "segment_offset": 4096,
+     "paragraphs": [{"id": "...", "text": "...", "version": 7, "deleted": false, "style": "Heading 1"}, ...]}
+
+- Every change bumps the document version and stamps the touched paragraphs
+  with it, so clients fetch only paragraphs changed since the version they hold.
+- Patches name the paragraph version they were based on; a paragraph changed
+  by someone else in the meantime is a conflict (HTTP 409), while edits of
+  different paragraphs merge.
+- Deleted paragraphs stay as tombstones so "since N" reports deletions.
+- New transcript segments are appended from the segment log (transcript.jsonl).
+- The DOCX is only re-rendered when someone needs the file (download, PDF)
+  and the document changed since the last render.
+
+The store is created from the existing transcript DOCX on the first edit;
+until then reads come straight from the DOCX (parsed again only when the file
+changed) and ensure_transcript_docx keeps appending segments to it directly.
+Paragraphs imported from the DOCX keep their style name, so a re-render does
+not turn headings into body text.
+"""
+import difflib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from docx import Document
+
+from metrics import stage_timer
+from utils import (MEETINGS_DIR, TRANSCRIPT_STATE_FILE, ensure_transcript_docx, file_lock,
+                   read_transcript_segments, transcript_docx_path, write_json_atomic)
+
+DOCUMENT_FILE = "document.json"
+
+# Read views of meetings without a store, keyed by the DOCX (mtime, size)
+VIEW_CACHE_SIZE = 64
+_view_cache = OrderedDict()
+_view_cache_lock = threading.Lock()
+
+
+class DocumentConflict(Exception):
+    """A patch touched paragraphs that changed after the version it was based on"""
+
+    def __init__(self, version, paragraph_ids):
+        super().__init__(f"document changed since the client's version (now {version})")
+        self.version = version
+        self.paragraph_ids = paragraph_ids
+
+
+def document_path(meeting_id):
+    return os.path.join(MEETINGS_DIR, meeting_id, DOCUMENT_FILE)
+
+
+def has_document(meeting_id):
+    return os.path.exists(document_path(meeting_id))
+
+
+def _lock(meeting_id):
+    # Same lock as ensure_transcript_docx: the DOCX and segment offsets are shared
+    return file_lock(os.path.join(MEETINGS_DIR, meeting_id, ".transcript.lock"))
+
+
+def _new_id():
+    return uuid.uuid4().hex[:12]
+
+
+def _segment_line(entry):
+    return f"({entry.get('ts', '')}) {entry.get('full_name', 'Unknown')} - {entry.get('role', '')}: {entry.get('text', '')}"
+
+
+def _load(meeting_id):
+    """Load the store, creating it from the transcript DOCX on first access. Returns None for unknown meetings."""
+    if not os.path.isdir(os.path.join(MEETINGS_DIR, meeting_id)):
+        return None
+    path = document_path(meeting_id)
+    if not os.path.exists(path):
+        # Bring the DOCX up to date with the segment log first (takes the lock itself)
+        ensure_transcript_docx(meeting_id)
+        with _lock(meeting_id):
+            if not os.path.exists(path):
+                write_json_atomic(path, _import_docx(meeting_id))
+        with _view_cache_lock:
+            _view_cache.pop(meeting_id, None)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _import_docx(meeting_id):
+    """
+    Document built from the paragraphs of the current DOCX (caller holds the lock).
+
+    Until the first edit creates the store, reads are served from this view
+    without persisting it. Ids and versions are derived from the paragraph
+    index so they stay the same across reads and in the store created later:
+    the DOCX only grows by appended segments until then, so "since N" still
+    returns exactly the new paragraphs.
+    """
+    docx_path = transcript_docx_path(meeting_id)
+    paragraphs = Document(docx_path).paragraphs if os.path.exists(docx_path) else []
+    offset = 0
+    state_path = os.path.join(MEETINGS_DIR, meeting_id, TRANSCRIPT_STATE_FILE)
+    if os.path.exists(state_path) and os.path.exists(docx_path):
+        with open(state_path, "r", encoding="utf-8") as f:
+            offset = json.load(f)["offset"]
+    version = len(paragraphs) + 1  # paragraph i has version i + 2, so an empty document is version 1
+    return {
+        "version": version,
+        "docx_version": version if os.path.exists(docx_path) else 0,
+        "segment_offset": offset,
+        "paragraphs": [{"id": f"p{i}", "text": p.text, "version": i + 2, "deleted": False,
+                        "style": p.style.name if p.style is not None else None}
+                       for i, p in enumerate(paragraphs)],
+    }
+
+
+def _cached_import(meeting_id):
+    """_import_docx, reused while the DOCX is unchanged so polls do not re-parse it (caller holds the lock)"""
+    try:
+        st = os.stat(transcript_docx_path(meeting_id))
+    except OSError:
+        return _import_docx(meeting_id)
+    key = (st.st_mtime_ns, st.st_size)
+    with _view_cache_lock:
+        cached = _view_cache.get(meeting_id)
+        if cached is not None and cached[0] == key:
+            _view_cache.move_to_end(meeting_id)
+            return cached[1]
+    view = _import_docx(meeting_id)
+    with _view_cache_lock:
+        _view_cache[meeting_id] = (key, view)
+        _view_cache.move_to_end(meeting_id)
+        while len(_view_cache) > VIEW_CACHE_SIZE:
+            _view_cache.popitem(last=False)
+    return view
+
+
+def _sync_segments(meeting_id, doc):
+    """Append transcript segments that arrived since the last sync (caller holds the lock)"""
+    entries, offset = read_transcript_segments(meeting_id, doc["segment_offset"])
+    if not entries:
+        return False
+    doc["version"] += 1
+    for entry in entries:
+        doc["paragraphs"].append({"id": _new_id(), "text": _segment_line(entry), "version": doc["version"], "deleted": False})
+    doc["segment_offset"] = offset
+    return True
+
+
+def _current(meeting_id):
+    """Load and sync under the lock; returns the document (or None) and persists new segments"""
+    doc = _load(meeting_id)
+    if doc is None:
+        return None
+    with _lock(meeting_id):
+        with open(document_path(meeting_id), "r", encoding="utf-8") as f:
+            doc = json.load(f)
+        if _sync_segments(meeting_id, doc):
+            write_json_atomic(document_path(meeting_id), doc)
+    return doc
+
+
+def _view(meeting_id):
+    """Current document for reads: the store if it exists, otherwise the DOCX (nothing is created)"""
+    if has_document(meeting_id):
+        return _current(meeting_id)
+    if not os.path.isdir(os.path.join(MEETINGS_DIR, meeting_id)):
+        return None
+    ensure_transcript_docx(meeting_id)
+    with _lock(meeting_id):
+        if not has_document(meeting_id):
+            return _cached_import(meeting_id)
+    return _current(meeting_id)
+
+
+def _live(doc):
+    return [p for p in doc["paragraphs"] if not p["deleted"]]
+
+
+def get_paragraphs(meeting_id, since=0):
+    """
+    Return (version, changes) where changes are the paragraphs (including
+    deleted tombstones) changed after `since`, each with the id of the live
+    paragraph it follows ("after", None = first). Returns None for unknown meetings.
+    """
+    doc = _view(meeting_id)
+    if doc is None:
+        return None
+    changes = []
+    previous = None
+    for p in doc["paragraphs"]:
+        if p["version"] > since:
+            changes.append({**p, "after": previous})
+        if not p["deleted"]:
+            previous = p["id"]
+    return doc["version"], changes
+
+
+def get_text(meeting_id):
+    """Return (version, full text) of the live paragraphs, or None for unknown meetings"""
+    doc = _view(meeting_id)
+    if doc is None:
+        return None
+    return doc["version"], "\n".join(p["text"] for p in _live(doc))
+
+
+def apply_patch(meeting_id, ops, base_version=None):
+    """
+    Apply paragraph operations atomically and return the new document version:
+        {"op": "update", "id": ..., "text": ..., "version": v}
+        {"op": "insert", "after": id | None, "text": ...}   (None = at the start;
+                                                            inserts with the same "after" keep their order)
+        {"op": "delete", "id": ..., "version": v}
+    `version` is the paragraph version the client edited; without it the
+    document-level base_version is used. Raises DocumentConflict if a touched
+    paragraph changed since, KeyError/ValueError for invalid operations.
+    """
+    if _load(meeting_id) is None:
+        raise KeyError(meeting_id)
+    with _lock(meeting_id):
+        with open(document_path(meeting_id), "r", encoding="utf-8") as f:
+            doc = json.load(f)
+        _sync_segments(meeting_id, doc)
+
+        by_id = {p["id"]: p for p in doc["paragraphs"]}
+        conflicts = []
+        for op in ops:
+            if op.get("op") not in ("update", "insert", "delete"):
+                raise ValueError(f"unknown op: {op.get('op')}")
+            if op["op"] == "insert":
+                if op.get("after") is not None and op["after"] not in by_id:
+                    raise KeyError(op["after"])
+                continue
+            paragraph = by_id.get(op.get("id"))
+            if paragraph is None:
+                raise KeyError(op.get("id"))
+            seen = op.get("version", base_version)
+            if seen is None or paragraph["version"] > seen:
+                conflicts.append(paragraph["id"])
+        if conflicts:
+            raise DocumentConflict(doc["version"], conflicts)
+
+        version = doc["version"] + 1
+        inserted_after = {}  # anchor -> last paragraph inserted there, so a run of inserts keeps its order
+        for op in ops:
+            if op["op"] == "insert":
+                paragraph = {"id": _new_id(), "text": op.get("text", ""), "version": version, "deleted": False}
+                anchor = inserted_after.get(op.get("after"), op.get("after"))
+                index = 0 if anchor is None else doc["paragraphs"].index(by_id[anchor]) + 1
+                doc["paragraphs"].insert(index, paragraph)
+                by_id[paragraph["id"]] = paragraph
+                inserted_after[op.get("after")] = paragraph["id"]
+            else:
+                paragraph = by_id[op["id"]]
+                if op["op"] == "update":
+                    paragraph["text"] = op.get("text", "")
+                else:
+                    paragraph["deleted"] = True
+                paragraph["version"] = version
+        doc["version"] = version
+        write_json_atomic(document_path(meeting_id), doc)
+        return version
+
+
+def replace_text(meeting_id, content, base_version=None):
+    """
+    Whole-document save (legacy push_document): diff the new lines against the
+    live paragraphs and apply only the changed ones, so unchanged paragraphs
+    keep their ids and versions. With base_version, touching a paragraph that
+    changed after it (including segments the client has not seen) is a conflict.
+    """
+    doc = _current(meeting_id)
+    if doc is None:
+        raise KeyError(meeting_id)
+    live = _live(doc)
+    lines = content.split("\n")
+    ops = []
+    matcher = difflib.SequenceMatcher(a=[p["text"] for p in live], b=lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        old, new = live[i1:i2], lines[j1:j2]
+        for p, text in zip(old, new):
+            ops.append({"op": "update", "id": p["id"], "text": text,
+                        "version": p["version"] if base_version is None else base_version})
+        for p in old[len(new):]:
+            ops.append({"op": "delete", "id": p["id"],
+                        "version": p["version"] if base_version is None else base_version})
+        if len(new) > len(old):
+            anchor = old[-1]["id"] if old else (live[i1 - 1]["id"] if i1 > 0 else None)
+            for text in new[len(old):]:
+                ops.append({"op": "insert", "after": anchor, "text": text})
+    if not ops:
+        return doc["version"]
+    return apply_patch(meeting_id, ops, base_version)
+
+
+def render_docx(meeting_id):
+    """Write the DOCX from the store if it changed since the last render; returns its path"""
+    doc = _current(meeting_id)
+    if doc is None:
+        return None
+    docx_path = transcript_docx_path(meeting_id)
+    with _lock(meeting_id):
+        with open(document_path(meeting_id), "r", encoding="utf-8") as f:
+            doc = json.load(f)
+        if doc["docx_version"] == doc["version"] and os.path.exists(docx_path):
+            return docx_path
+        os.makedirs(os.path.dirname(docx_path), exist_ok=True)
+        # Keep the existing file's styles and section settings, replace its body
+        document = Document(docx_path) if os.path.exists(docx_path) else Document()
+        document._body.clear_content()
+        for p in _live(doc):
+            try:
+                document.add_paragraph(p["text"], style=p.get("style"))
+            except KeyError:
+                # Style not defined in this file (e.g. the DOCX was replaced)
+                document.add_paragraph(p["text"])
+        tmp_path = f"{docx_path}.{os.getpid()}.tmp"
+        with stage_timer("docx_write"):
+            document.save(tmp_path)
+        os.replace(tmp_path, docx_path)
+        doc["docx_version"] = doc["version"]
+        write_json_atomic(document_path(meeting_id), doc)
+        return docx_path
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Per-meeting index of chunk and final-file metadata for /api/meeting_files.
+
+Metadata (timestamp, user, size, duration) is recorded once when a file is
+written instead of listdir + getsize + strptime on every poll. The index
+lives in Redis, one set of hashes per meeting and folder:
+
+    meeting-files:<meeting_id>:<type>          filename -> metadata JSON
+    meeting-files:<meeting_id>:<type>:status   filename -> STT status JSON (chunks)
+    meeting-files:<meeting_id>:<type>:seq      filename -> version of its last change
+    meeting-files:<meeting_id>:<type>:meta     version, dir_mtime
+
+Every change bumps `version` atomically (Lua), so the version doubles as the
+listing's ETag and as the "since" cursor of polling clients. Files written
+behind the index's back (older meetings, final outputs of merge/PDF jobs,
+signed PDFs) are picked up by sync_index: chunk files are immutable, so the
+chunks folder is only re-listed when its mtime changed; the final folder is
+small and its files are rewritten in place, so it is re-stat'ed on each call.
+"""
+import json
+import logging
+import os
+import wave
+from datetime import datetime
+
+from utils import r
+
+logger = logging.getLogger(__name__)
+
+MEETINGS_DIR = os.getenv("MEETINGS_DIR", "meetings")
+FILE_INDEX_PREFIX = os.getenv("FILE_INDEX_PREFIX", "meeting-files")
+# The index can always be rebuilt from disk; only STT status is lost on expiry
+FILE_INDEX_TTL_SECONDS = int(os.getenv("FILE_INDEX_TTL_SECONDS", str(30 * 24 * 3600)))
+
+# KEYS: meta, target hash, seq hash, status hash
+# ARGV: dir_mtime ("" = keep), ttl, then filename/value pairs ("" value = delete)
+UPDATE_INDEX_LUA = """
+local version = redis.call("HINCRBY", KEYS[1], "version", 1)
+for i = 3, #ARGV, 2 do
+    if ARGV[i + 1] == "" then
+        redis.call("HDEL", KEYS[2], ARGV[i])
+        redis.call("HDEL", KEYS[3], ARGV[i])
+        redis.call("HDEL", KEYS[4], ARGV[i])
+    else
+        redis.call("HSET", KEYS[2], ARGV[i], ARGV[i + 1])
+        redis.call("HSET", KEYS[3], ARGV[i], version)
+    end
+end
+if ARGV[1] ~= "" then
+    redis.call("HSET", KEYS[1], "dir_mtime", ARGV[1])
+end
+for i = 1, #KEYS do
+    redis.call("EXPIRE", KEYS[i], tonumber(ARGV[2]))
+end
+return version
+"""
+_update_index_script = r.register_script(UPDATE_INDEX_LUA)
+
+
+def index_key(meeting_id, file_type, suffix=None):
+    key = f"{FILE_INDEX_PREFIX}:{meeting_id}:{file_type}"
+    return f"{key}:{suffix}" if suffix else key
+
+
+def _update(meeting_id, file_type, target, values, dir_mtime=None):
+    """Apply {filename: metadata-or-None} to one index hash and return the new version"""
+    args = ["" if dir_mtime is None else str(dir_mtime), FILE_INDEX_TTL_SECONDS]
+    for filename, value in values.items():
+        args += [filename, "" if value is None else json.dumps(value)]
+    keys = [
+        index_key(meeting_id, file_type, "meta"),
+        index_key(meeting_id, file_type, target),
+        index_key(meeting_id, file_type, "seq"),
+        index_key(meeting_id, file_type, "status"),
+    ]
+    return int(_update_index_script(keys=keys, args=args, client=r))
+
+
+def wav_duration(path):
+    """Duration in seconds from the WAV header, or None if the file is not a readable WAV"""
+    try:
+        with wave.open(path, "rb") as w:
+            return round(w.getnframes() / float(w.getframerate()), 3)
+    except Exception:
+        return None
+
+
+def file_metadata(path, stat_result=None):
+    """Metadata of one file, parsed from its name (dd-mm-yyyy_HH-MM-SS__user__...) and stat"""
+    fname = os.path.basename(path)
+    st = stat_result or os.stat(path)
+    parts = fname.split("__")
+    try:
+        dt = datetime.strptime(parts[0], "%d-%m-%Y_%H-%M-%S")
+        date_str = dt.strftime("%d/%m/%Y %H:%M:%S")
+        timestamp = dt.isoformat()
+    except Exception:
+        date_str, timestamp = "", None
+    return {
+        "filename": fname,
+        "date": date_str,
+        "timestamp": timestamp,
+        "user_id": parts[1] if timestamp and len(parts) >= 3 else None,
+        "size": st.st_size,
+        "mtime": st.st_mtime_ns,
+        "duration": wav_duration(path) if fname.lower().endswith(".wav") else None,
+    }
+
+
+def record_file(meeting_id, file_type, path):
+    """Index a file that was just written"""
+    return _update(meeting_id, file_type, None, {os.path.basename(path): file_metadata(path)})
+
+
+def set_chunk_status(meeting_id, filepath, transcript, **fields):
+    """Record the STT outcome of a chunk (queued, done, skipped, failed)"""
+    status = {"transcript": transcript, **fields}
+    return _update(meeting_id, "chunks", "status", {os.path.basename(filepath): status})
+
+
+def sync_index(meeting_id, file_type):
+    """Reconcile the index with the folder on disk; returns the current version"""
+    folder = os.path.join(MEETINGS_DIR, meeting_id, file_type)
+    dir_mtime = os.stat(folder).st_mtime_ns
+    pipe = r.pipeline()
+    pipe.hmget(index_key(meeting_id, file_type, "meta"), "version", "dir_mtime")
+    pipe.hgetall(index_key(meeting_id, file_type))
+    (version, indexed_mtime), indexed = pipe.execute()
+    version = int(version or 0)
+
+    if file_type == "chunks" and indexed_mtime is not None and int(indexed_mtime) == dir_mtime:
+        return version
+
+    indexed = {k.decode(): json.loads(v) for k, v in indexed.items()}
+    changes = {}
+    on_disk = set()
+    with os.scandir(folder) as it:
+        for entry in it:
+            # Dot files are internal (artifact manifest, temp files of conversions)
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            on_disk.add(entry.name)
+            known = indexed.get(entry.name)
+            if known is not None and file_type == "chunks":
+                continue
+            st = entry.stat()
+            if known is None or known.get("size") != st.st_size or known.get("mtime") != st.st_mtime_ns:
+                changes[entry.name] = file_metadata(entry.path, st)
+    for name in indexed:
+        if name not in on_disk:
+            changes[name] = None
+
+    if changes:
+        version = _update(meeting_id, file_type, None, changes, dir_mtime=dir_mtime)
+    elif indexed_mtime is None or int(indexed_mtime) != dir_mtime:
+        # Nothing new (e.g. the writer already recorded its file): remember the
+        # mtime without bumping the version, so polling clients keep their ETag
+        r.hset(index_key(meeting_id, file_type, "meta"), "dir_mtime", dir_mtime)
+    return version
+
+
+def list_files(meeting_id, file_type):
+    """Return (version, [entry, ...]) sorted by timestamp, each entry with its STT status and seq"""
+    pipe = r.pipeline()  # MULTI: one consistent snapshot of the index
+    pipe.hget(index_key(meeting_id, file_type, "meta"), "version")
+    pipe.hgetall(index_key(meeting_id, file_type))
+    pipe.hgetall(index_key(meeting_id, file_type, "status"))
+    pipe.hgetall(index_key(meeting_id, file_type, "seq"))
+    version, entries, statuses, seqs = pipe.execute()
+
+    files = []
+    for name, raw in entries.items():
+        entry = json.loads(raw)
+        seq = int(seqs.get(name) or 0)
+        if file_type == "chunks":
+            status = json.loads(statuses[name]) if name in statuses else {}
+            entry["transcript"] = status.get("transcript")
+            if entry.get("duration") is None:
+                entry["duration"] = status.get("duration")
+        entry["seq"] = seq
+        files.append(entry)
+    files.sort(key=lambda e: (e["timestamp"] or "", e["filename"]))
+    return int(version or 0), files
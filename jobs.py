@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
 import os
+import json
 import logging
-from utils import merge_audio_chunks_direct, build_docx_and_pdf, build_transcript_from_cache
+import time
+import uuid
+import zlib
+from utils import r, stt_pending_key, mark_stt_finished, merge_audio_chunks_direct, merge_audio_chunks_incremental, merge_audio_chunks_streaming, build_docx_and_pdf, build_transcript_from_cache
 from datetime import datetime
 import threading
-import queue
+from metrics import (JOBS_ENQUEUED, JOBS_FINISHED, JOB_WAIT, JOB_DURATION, STT_AUDIO_SECONDS, STT_SKIPPED,
+                     STT_REALTIME_FACTOR, STT_BATCH_SIZE as STT_BATCH_SIZE_METRIC, WORKER_BUSY, WORKER_IDLE,
+                     stage_timer)
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -12,81 +18,486 @@ logger = logging.getLogger(__name__)
 
 MEETINGS_DIR = os.getenv("MEETINGS_DIR", "meetings")
 
-# Global job queue
-job_queue = queue.Queue()
+# Redis lists shared by the web tier (producer) and stt_service.py (consumer).
+# The web tier never loads the model; it only pushes job descriptions here.
+# Jobs are split into lanes ("stt", "merge") and each lane is sharded by
+# meeting_id, so one meeting is always handled by the same worker (in order)
+# while different meetings run in parallel. The web tier and the service must
+# agree on the worker counts below.
+JOB_QUEUE_PREFIX = os.getenv("JOB_QUEUE_PREFIX", "meeting-jobs")
+STT_WORKERS = max(1, int(os.getenv("STT_WORKERS", "1")))
+MERGE_WORKERS = max(1, int(os.getenv("MERGE_WORKERS", "1")))
+PDF_WORKERS = max(1, int(os.getenv("PDF_WORKERS", "2")))
+LANE_WORKERS = {"stt": STT_WORKERS, "merge": MERGE_WORKERS, "pdf": PDF_WORKERS}
+JOB_LANES = {"stt": "stt", "merge_audio": "merge", "convert_pdf": "pdf"}
+# "incremental": only decode chunks added since the last merge (default)
+# "stream": decode every chunk, one at a time, into a piped ffmpeg encoder
+# "direct": decode every chunk into one in-memory AudioSegment
+MERGE_MODE = os.getenv("MERGE_MODE", "incremental")
+MERGE_FUNCTIONS = {
+    "incremental": merge_audio_chunks_incremental,
+    "stream": merge_audio_chunks_streaming,
+    "direct": merge_audio_chunks_direct,
+}
+
+# Batched inference: an STT worker takes up to STT_BATCH_SIZE queued chunks
+# (any meeting on its shard) and waits at most STT_BATCH_WAIT_MS for the batch
+# to fill. STT_BATCH_SIZE=1 disables batching.
+STT_BATCH_SIZE = max(1, int(os.getenv("STT_BATCH_SIZE", "4")))
+STT_BATCH_WAIT_MS = int(os.getenv("STT_BATCH_WAIT_MS", "200"))
+
+# How long finished job statuses are kept in Redis
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", str(7 * 24 * 3600)))
+# A job whose worker died this many times while running it is moved to the
+# lane's dead-letter list instead of being re-queued again
+JOB_MAX_ATTEMPTS = max(1, int(os.getenv("JOB_MAX_ATTEMPTS", "3")))
+
+def get_stt_backend(tier=None):
+    """
+    STT backend for a quality tier, from the process-wide model registry
+    (see stt_backends.ModelRegistry). Models load lazily, so only
+    stt_service.py should call this and gunicorn workers importing this
+    module never hold model weights.
+    """
+    from stt_backends import registry
+    return registry.for_tier(tier)
+
+def shard_for_meeting(meeting_id, n_shards):
+    """Stable shard index for a meeting (crc32, so all processes agree)"""
+    return zlib.crc32(str(meeting_id).encode("utf-8")) % n_shards
+
+def queue_key(lane, shard):
+    return f"{JOB_QUEUE_PREFIX}:{lane}:{shard}"
+
+def queue_key_for_job(job_type, meeting_id):
+    lane = JOB_LANES.get(job_type)
+    if lane is None:
+        raise ValueError(f"Unknown job type: {job_type}")
+    return queue_key(lane, shard_for_meeting(meeting_id, LANE_WORKERS[lane]))
+
+def processing_key(queue):
+    return f"{queue}:processing"
+
+def dead_letter_key(lane):
+    return f"{JOB_QUEUE_PREFIX}:{lane}:dead"
+
+def job_key(job_id):
+    return f"{JOB_QUEUE_PREFIX}:job:{job_id}"
 
-# Initialize Whisper model globally
-import whisper
-WHISPER_MODEL = whisper.load_model("medium")
+def set_job_state(job_id, state, **fields):
+    """
+    Record a job lifecycle transition (queued -> running -> done | failed)
+    with a timestamp. Finished jobs expire after JOB_TTL_SECONDS.
+    """
+    if not job_id:
+        return
+    mapping = {"state": state, f"{state}_at": datetime.utcnow().isoformat()}
+    for name, value in fields.items():
+        mapping[name] = value if isinstance(value, str) else json.dumps(value)
+    pipe = r.pipeline()
+    pipe.hset(job_key(job_id), mapping=mapping)
+    if state in ("done", "failed"):
+        pipe.expire(job_key(job_id), JOB_TTL_SECONDS)
+    pipe.execute()
+
+def get_job_status(job_id):
+    """Return the stored status of a job (a single HGETALL), or None if unknown/expired"""
+    data = r.hgetall(job_key(job_id))
+    if not data:
+        return None
+    status = {k.decode(): v.decode() for k, v in data.items()}
+    if "result" in status:
+        status["result"] = json.loads(status["result"])
+    return status
 
 class JobWorker(threading.Thread):
-    """Background worker thread for sequential job processing"""
-    def __init__(self):
-        super().__init__(daemon=True)
+    """
+    Background worker thread that consumes one shard of a job lane.
+
+    Jobs are moved atomically from the queue to a per-shard processing list
+    (BRPOPLPUSH) and removed only once they finished, so a crash or restart
+    never loses them: on startup the worker puts unfinished jobs back.
+    """
+    def __init__(self, lane="stt", shard=0):
+        super().__init__(daemon=True, name=f"{lane}-worker-{shard}")
+        self.lane = lane
+        self.shard = shard
+        self.queue_key = queue_key(lane, shard)
+        self.processing_key = processing_key(self.queue_key)
         self.running = True
 
     def run(self):
-        logger.info("🔄 Job Worker started")
+        logger.info(f"🔄 Job Worker started on {self.queue_key}")
+        self.requeue_unfinished()
         while self.running:
+            busy_since = None
             try:
                 # Get job from queue
-                job_type, args, kwargs = job_queue.get(timeout=1)
-                logger.info(f"⚙️ Processing job: {job_type} with args={args}")
+                idle_since = time.perf_counter()
+                raw = r.brpoplpush(self.queue_key, self.processing_key, timeout=1)
+                WORKER_IDLE.labels(self.lane).inc(time.perf_counter() - idle_since)
+                if raw is None:
+                    continue
+                busy_since = time.perf_counter()
+                items = [raw]
+
+                if self.lane == "stt" and STT_BATCH_SIZE > 1:
+                    items += self.collect_batch(STT_BATCH_SIZE - 1)
+                    if len(items) > 1:
+                        self.process_stt_batch(items)
+                        continue
+
+                self.execute_job(raw)
 
-                # Process jobs sequentially
-                if job_type == "stt":
-                    result = self.process_stt_job(*args, **kwargs)
-                elif job_type == "merge_audio":
-                    result = enqueue_merge_job(*args, **kwargs)
+            except Exception as e:
+                logger.error(f"❌ Job failed: {str(e)}", exc_info=True)
+            finally:
+                if busy_since is not None:
+                    WORKER_BUSY.labels(self.lane).inc(time.perf_counter() - busy_since)
 
-                logger.info(f"✅ Job completed: {result}")
-                job_queue.task_done()
+    def requeue_unfinished(self):
+        """
+        Move jobs left in the processing list by a previous run back to the head
+        of the queue (the right end, where workers pop), oldest first in line, so
+        a meeting's chunks keep their order.
 
-            except queue.Empty:
+        Every re-queue counts as an attempt in the job status hash; a job that
+        already took down its worker JOB_MAX_ATTEMPTS times is marked failed and
+        moved to the lane's dead-letter list, so it cannot crash-loop the shard.
+        """
+        requeued = dead = 0
+        # The processing list has the newest job on the left: moving LEFT -> RIGHT
+        # leaves the oldest one at the consumer end
+        while True:
+            raw = r.lindex(self.processing_key, 0)
+            if raw is None:
+                break
+            try:
+                job = json.loads(raw)
+            except ValueError:
+                job = None
+            job_id = job.get("id") if isinstance(job, dict) else None
+            if job_id and r.hincrby(job_key(job_id), "attempts", 1) >= JOB_MAX_ATTEMPTS:
+                self.dead_letter(job, raw)
+                dead += 1
                 continue
+            r.lmove(self.processing_key, self.queue_key, "LEFT", "RIGHT")
+            requeued += 1
+        if requeued:
+            logger.info(f"♻️ Re-queued {requeued} unfinished job(s) on {self.queue_key}")
+        if dead:
+            logger.error(f"☠️ Moved {dead} job(s) to {dead_letter_key(self.lane)} after {JOB_MAX_ATTEMPTS} attempts")
+
+    def dead_letter(self, job, raw):
+        """Fail a job that keeps crashing its worker and park it on the dead-letter list"""
+        error = RuntimeError(f"worker died {JOB_MAX_ATTEMPTS} times while running this job")
+        set_job_state(job.get("id"), "failed", error=str(error))
+        self.record_chunk_status(job, error=error)
+        JOBS_FINISHED.labels(job.get("type", "unknown"), "failed").inc()
+        r.lpush(dead_letter_key(self.lane), raw)
+        # Drops it from the processing list (and counts a STT job as finished)
+        self.finish(raw)
+
+    def collect_batch(self, max_jobs):
+        """Pull up to max_jobs more queued jobs, waiting at most STT_BATCH_WAIT_MS"""
+        items = []
+        deadline = time.monotonic() + STT_BATCH_WAIT_MS / 1000.0
+        while len(items) < max_jobs:
+            raw = r.rpoplpush(self.queue_key, self.processing_key)
+            if raw is not None:
+                items.append(raw)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(0.01, remaining))
+        return items
+
+    def finish(self, raw):
+        """Drop a finished job from the processing list and update the meeting's STT counter (atomically)"""
+        try:
+            job = json.loads(raw)
+        except ValueError:
+            job = None
+        if isinstance(job, dict) and job.get("type") == "stt":
+            mark_stt_finished(job["args"][0], self.processing_key, raw)
+        else:
+            r.lrem(self.processing_key, 1, raw)
+
+    def execute_job(self, raw):
+        """Run one queued job, tracking its state, then drop it from the processing list"""
+        job = job_id = None
+        job_type = "unknown"
+        started = time.perf_counter()
+        try:
+            job = json.loads(raw)
+            job_id = job.get("id")
+            job_type = job.get("type", job_type)
+            self.observe_wait(job)
+            set_job_state(job_id, "running")
+            result = self.process_job(job)
+            set_job_state(job_id, "done", result=result)
+            self.record_chunk_status(job, result)
+            JOBS_FINISHED.labels(job_type, "done").inc()
+            logger.info(f"✅ Job completed: {result}")
+            return result
+        except Exception as e:
+            set_job_state(job_id, "failed", error=str(e))
+            self.record_chunk_status(job, error=e)
+            JOBS_FINISHED.labels(job_type, "failed").inc()
+            raise
+        finally:
+            JOB_DURATION.labels(job_type).observe(time.perf_counter() - started)
+            self.finish(raw)
+
+    @staticmethod
+    def observe_wait(job):
+        """Time the job spent in the queue (jobs enqueued before this field existed are skipped)"""
+        if isinstance(job, dict) and job.get("enqueued_at"):
+            JOB_WAIT.labels(job.get("type", "unknown")).observe(max(0.0, time.time() - job["enqueued_at"]))
+
+    @staticmethod
+    def record_chunk_status(job, result=None, error=None):
+        """Show the STT outcome of a chunk in the meeting file index (see file_index.py)"""
+        if not isinstance(job, dict) or job.get("type") != "stt":
+            return
+        from file_index import set_chunk_status
+        meeting_id, filepath = job["args"][0], job["args"][5]
+        if error is not None:
+            transcript = "failed"
+        elif result and result.get("skipped"):
+            transcript = "skipped"
+        else:
+            transcript = "done"
+        try:
+            set_chunk_status(meeting_id, filepath, transcript, job_id=job.get("id"))
+        except Exception as e:
+            logger.warning(f"Failed to update file index for {filepath}: {str(e)}")
+
+    def process_job(self, job):
+        job_type, args, kwargs = job["type"], job.get("args", []), job.get("kwargs", {})
+        logger.info(f"⚙️ Processing job: {job_type} with args={args}")
+
+        if job_type == "stt":
+            return self.process_stt_job(*args, **kwargs)
+        elif job_type == "merge_audio":
+            return enqueue_merge_job(*args, **kwargs)
+        elif job_type == "convert_pdf":
+            # Each pdf lane worker owns one warm LibreOffice instance
+            return enqueue_convert_pdf_job(*args, instance=self.shard, **kwargs)
+        raise ValueError(f"Unknown job type: {job_type}")
+
+    def process_stt_batch(self, items):
+        """
+        Transcribe a batch of STT jobs in one model call, then write each
+        result to its own meeting transcript in queue order.
+        """
+        logger.info(f"⚙️ Processing STT batch of {len(items)} jobs")
+        started = time.perf_counter()
+        STT_BATCH_SIZE_METRIC.observe(len(items))
+        try:
+            batch = [json.loads(raw) for raw in items]
+            for job in batch:
+                self.observe_wait(job)
+                set_job_state(job.get("id"), "running")
+            tiers = [job.get("kwargs", {}).get("tier") for job in batch]
+            speech = [self.load_speech(job["args"][0], job["args"][5]) for job in batch]
+            # One model call per model size: tiers mapped to the same size share a batch
+            from stt_backends import model_for_tier
+            groups = {}
+            for i, audio in enumerate(speech):
+                if audio is not None:
+                    groups.setdefault(model_for_tier(tiers[i]), []).append(i)
+            texts = [None] * len(batch)
+            for indices in groups.values():
+                group_texts = self.transcribe([speech[i] for i in indices], tiers[indices[0]])
+                for i, text in zip(indices, group_texts):
+                    texts[i] = text
+        except Exception as e:
+            logger.error(f"Batched transcription failed, falling back to single jobs: {str(e)}", exc_info=True)
+            for raw in items:
+                try:
+                    self.execute_job(raw)
+                except Exception as job_error:
+                    logger.error(f"❌ Job failed: {str(job_error)}", exc_info=True)
+            return
+
+        # Write each result to its segment log, then add the whole batch to
+        # the Redis transcript cache in one round-trip
+        from utils import (append_transcript_segment, append_transcript_cache_bulk, publish_transcript_segments,
+                           TranscriptCacheError)
+        outcomes = []
+        entries_by_meeting = {}
+        for raw, job, text in zip(items, batch, texts):
+            meeting_id, user_id, full_name, role, ts_str, filepath = job["args"]
+            try:
+                if text is None:
+                    result = {"meeting_id": meeting_id, "user_id": user_id, "skipped": "no_speech"}
+                else:
+                    entry = self.transcript_entry(user_id, full_name, role, ts_str, text, filepath)
+                    with stage_timer("transcript_log"):
+                        append_transcript_segment(meeting_id, entry)
+                    entries_by_meeting.setdefault(meeting_id, []).append(entry)
+                    result = {"meeting_id": meeting_id, "user_id": user_id, "text_len": len(text)}
+                outcomes.append((raw, job, result, None))
             except Exception as e:
-                logger.error(f"❌ Job failed: {str(e)}", exc_info=True)
-                job_queue.task_done()
+                logger.error(f"❌ Job failed for meeting_id={meeting_id}, file={filepath}: {str(e)}", exc_info=True)
+                outcomes.append((raw, job, None, e))
 
-    def process_stt_job(self, meeting_id, user_id, full_name, role, ts_str, filepath):
+        # Like store_transcript, a job whose transcript did not reach the cache
+        # fails instead of finishing without it
+        cache_errors = {}
+        if entries_by_meeting:
+            try:
+                with stage_timer("redis_append"):
+                    append_transcript_cache_bulk(entries_by_meeting)
+            except TranscriptCacheError as e:
+                cache_errors = e.errors
+            except Exception as e:
+                cache_errors = {meeting_id: e for meeting_id in entries_by_meeting}
+            if cache_errors:
+                logger.error(f"Failed to update transcript cache for meetings {sorted(cache_errors)}: "
+                             f"{next(iter(cache_errors.values()))}")
+            published = {m: entries for m, entries in entries_by_meeting.items() if m not in cache_errors}
+            try:
+                if published:
+                    with stage_timer("stream_publish"):
+                        publish_transcript_segments(published)
+            except Exception as e:
+                logger.error(f"Failed to publish live transcript segments: {str(e)}", exc_info=True)
+
+        elapsed = time.perf_counter() - started
+        for raw, job, result, error in outcomes:
+            meeting_id = job["args"][0]
+            if error is None and "text_len" in result and meeting_id in cache_errors:
+                result, error = None, cache_errors[meeting_id]
+            if error is None:
+                set_job_state(job.get("id"), "done", result=result)
+                logger.info(f"✅ Job completed: {result}")
+            else:
+                set_job_state(job.get("id"), "failed", error=str(error))
+            JOBS_FINISHED.labels("stt", "done" if error is None else "failed").inc()
+            JOB_DURATION.labels("stt").observe(elapsed)
+            self.record_chunk_status(job, result, error)
+            self.finish(raw)
+
+    def process_stt_job(self, meeting_id, user_id, full_name, role, ts_str, filepath, tier=None):
         """
-        Process a speech-to-text job using the global Whisper model.
+        Process a speech-to-text job using the service-owned STT backend
+        of the job's quality tier.
         """
         try:
             logger.info(f"Starting STT job for meeting_id={meeting_id}, user_id={user_id}, file={filepath}")
 
-            # Transcribe audio using the global Whisper model
-            result = WHISPER_MODEL.transcribe(filepath)
-            text = result["text"]
-            logger.info(f"Transcription complete. Text length: {len(text)}")
+            audio = self.load_speech(meeting_id, filepath)
+            if audio is None:
+                return {"meeting_id": meeting_id, "user_id": user_id, "skipped": "no_speech"}
 
-            # Append transcription to DOCX file
-            from utils import append_to_docx
-            append_to_docx(meeting_id, {
-                "ts": ts_str,
-                "user_id": user_id,
-                "full_name": full_name,
-                "role": role,
-                "text": text
-            })
+            # Transcribe audio using the service-owned STT backend
+            text = self.transcribe([audio], tier)[0]
+            logger.info(f"Transcription complete. Text length: {len(text)}")
 
-            return {"meeting_id": meeting_id, "user_id": user_id, "text_len": len(text)}
+            return self.store_transcript(meeting_id, user_id, full_name, role, ts_str, text, filepath)
 
         except Exception as e:
             logger.error(f"STT job failed: {str(e)}", exc_info=True)
             raise RuntimeError(f"STT job failed for meeting_id={meeting_id}, user_id={user_id}: {str(e)}")
 
+    def transcribe(self, audios, tier=None):
+        """Run the tier's backend on decoded clips (one batch) and record inference time and real-time factor"""
+        backend = get_stt_backend(tier)
+        started = time.perf_counter()
+        with stage_timer("inference"):
+            texts = backend.transcribe_batch(audios) if len(audios) > 1 else [backend.transcribe(audios[0])]
+        audio_seconds = sum(len(audio) for audio in audios) / 16000.0
+        if audio_seconds > 0:
+            STT_REALTIME_FACTOR.observe((time.perf_counter() - started) / audio_seconds)
+        return texts
+
+    def load_speech(self, meeting_id, filepath):
+        """
+        Decode a chunk to 16 kHz mono (once: the decode is cached for the merges,
+        see audio_cache) and run VAD on it.
+        Returns the audio trimmed to speech, or None for a chunk with no speech
+        (recorded in meetings/<id>/vad.jsonl).
+        """
+        import audio_cache
+        import vad
+
+        with stage_timer("decode"):
+            audio = audio_cache.load_audio(filepath)
+        STT_AUDIO_SECONDS.inc(len(audio) / 16000.0)
+        if not vad.VAD_ENABLED:
+            return audio
+
+        with stage_timer("vad"):
+            speech, info = vad.trim_to_speech(audio)
+        if speech is None:
+            STT_SKIPPED.inc()
+        if info["action"] != "kept":
+            logger.info(f"VAD {info['action']} {filepath}: {info}")
+            info.update({"file": os.path.basename(filepath), "at": datetime.utcnow().isoformat()})
+            with open(os.path.join(MEETINGS_DIR, meeting_id, "vad.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(info) + "\n")
+        return speech
+
+    @staticmethod
+    def transcript_entry(user_id, full_name, role, ts_str, text, filepath=None):
+        return {
+            "ts": ts_str,
+            "user_id": user_id,
+            "full_name": full_name,
+            "role": role,
+            "text": text,
+            "source_file": filepath,
+        }
+
+    def store_transcript(self, meeting_id, user_id, full_name, role, ts_str, text, filepath=None):
+        # Append transcription to the meeting's segment log (DOCX is built on demand)
+        # and to the Redis transcript cache used by enqueue_merge_transcript_job
+        from utils import append_transcript_segment, append_transcript_cache, publish_transcript_segments
+        entry = self.transcript_entry(user_id, full_name, role, ts_str, text, filepath)
+        with stage_timer("transcript_log"):
+            append_transcript_segment(meeting_id, entry)
+        with stage_timer("redis_append"):
+            append_transcript_cache(meeting_id, entry)
+        try:
+            with stage_timer("stream_publish"):
+                publish_transcript_segments({meeting_id: [entry]})
+        except Exception as e:
+            logger.error(f"Failed to publish live transcript segment: {str(e)}", exc_info=True)
+
+        return {"meeting_id": meeting_id, "user_id": user_id, "text_len": len(text)}
+
     def stop(self):
         self.running = False
 
-# Start a single worker thread for sequential processing
-worker = JobWorker()
-worker.start()
-
-def enqueue_job(job_type, *args, **kwargs):
-    """Enqueue job to be processed by worker threads"""
-    job_queue.put((job_type, args, kwargs))
-    logger.info(f"📥 Job enqueued: {job_type}")
+def enqueue_job(job_type, meeting_id, *args, **kwargs):
+    """
+    Enqueue job for the STT service and return its job_id.
+    Arguments must be JSON-serializable. Jobs of the same meeting land on
+    the same shard and keep their order.
+    """
+    key = queue_key_for_job(job_type, meeting_id)
+    job_id = uuid.uuid4().hex
+    job = {"id": job_id, "type": job_type, "args": [meeting_id, *args], "kwargs": kwargs, "enqueued_at": time.time()}
+
+    pipe = r.pipeline()  # MULTI: status and queue entry are written together
+    pipe.hset(job_key(job_id), mapping={
+        "id": job_id,
+        "type": job_type,
+        "meeting_id": meeting_id,
+        "queue": key,
+        "state": "queued",
+        "queued_at": datetime.utcnow().isoformat(),
+    })
+    pipe.lpush(key, json.dumps(job))
+    if job_type == "stt":
+        pipe.incr(stt_pending_key(meeting_id))
+    pipe.execute()
+    JOBS_ENQUEUED.labels(job_type).inc()
+    logger.info(f"📥 Job enqueued: {job_type} {job_id} -> {key}")
+    return job_id
 
 def enqueue_merge_transcript_job(meeting_id):
     """
@@ -107,10 +518,6 @@ def enqueue_merge_transcript_job(meeting_id):
 
         os.makedirs(final_dir, exist_ok=True)
 
-        # Delete old transcript files
-        logger.info(f"Deleting old transcript files in {final_dir}")
-        delete_old_transcripts(final_dir)
-
         # Get transcripts from cache
         logger.info(f"Fetching transcripts from cache for meeting_id={meeting_id}")
         entries = build_transcript_from_cache(meeting_id)
@@ -119,6 +526,23 @@ def enqueue_merge_transcript_job(meeting_id):
         if not entries:
             raise RuntimeError("No transcripts found in cache")
 
+        # Reuse the DOCX if it was built from exactly these entries
+        from utils import transcript_docx_key, get_cached_artifact, store_artifact
+        docx_key = transcript_docx_key(meeting_id, entries)
+        cached_path = get_cached_artifact(final_dir, "merged_transcript", docx_key)
+        if cached_path:
+            logger.info(f"Transcript unchanged, reusing {cached_path}")
+            return {
+                "status": "transcript_cached",
+                "meeting_id": meeting_id,
+                "output": cached_path,
+                "total_transcripts": len(entries)
+            }
+
+        # Delete old transcript files
+        logger.info(f"Deleting old transcript files in {final_dir}")
+        delete_old_transcripts(final_dir)
+
         # Create DOCX file
         docx_path = os.path.join(final_dir, f"transcript_{meeting_id}_{timestamp}.docx")
         logger.info(f"Creating DOCX file: {docx_path}")
@@ -138,6 +562,7 @@ def enqueue_merge_transcript_job(meeting_id):
             doc.add_paragraph(line)
 
         doc.save(docx_path)
+        store_artifact(final_dir, "merged_transcript", docx_key, docx_path)
         logger.info(f"DOCX file saved successfully: {docx_path}")
 
         result = {
@@ -200,9 +625,11 @@ def enqueue_merge_job(meeting_id):
                     log.write(f"Error deleting old OGG files: {e}\n")
                     log.flush()
 
-                log.write("Starting audio merge with direct format conversion...\n")
+                merge_fn = MERGE_FUNCTIONS.get(MERGE_MODE, merge_audio_chunks_incremental)
+                log.write(f"Starting audio merge ({merge_fn.__name__})...\n")
                 log.flush()
-                merge_audio_chunks_direct(chunks_dir, merged_ogg_path, log_file=log_path)
+                with stage_timer("merge"):
+                    merge_fn(chunks_dir, merged_ogg_path, log_file=log_path)
                 log.write(f"Merge and OGG conversion completed successfully!\n")
                 log.write(f"Merged OGG file: {merged_ogg_path}\n")
                 log.flush()
@@ -236,3 +663,21 @@ def enqueue_merge_job(meeting_id):
         "status": "merged",
         "output": merged_ogg_path if merged_ogg_path and os.path.exists(merged_ogg_path) else None
     }
+
+
+def enqueue_convert_pdf_job(meeting_id, docx_path, pdf_path, instance=0):
+    """Convert a meeting DOCX to PDF on a warm LibreOffice instance (see pdf_service)"""
+    from pdf_service import convert_docx_to_pdf
+    from utils import pdf_artifact_key, get_cached_artifact, store_artifact
+
+    output_dir = os.path.dirname(pdf_path)
+    name = f"pdf:{os.path.basename(docx_path)}"
+    pdf_key = pdf_artifact_key(docx_path)
+    if get_cached_artifact(output_dir, name, pdf_key):
+        return {"status": "cached", "meeting_id": meeting_id, "pdf_path": pdf_path}
+
+    logger.info(f"Converting {docx_path} to PDF on LibreOffice instance {instance}")
+    with stage_timer("pdf_convert"):
+        convert_docx_to_pdf(docx_path, pdf_path, instance=instance)
+    store_artifact(output_dir, name, pdf_key, pdf_path)
+    return {"status": "converted", "meeting_id": meeting_id, "pdf_path": pdf_path}
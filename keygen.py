@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Signing key provisioning for /api/create_key and /api/create_keys.
+
+RSA-2048 generation is CPU-heavy, so it runs in a process pool
+(KEYGEN_WORKERS processes) instead of the gunicorn worker. With
+KEY_POOL_SIZE > 0 a background thread also keeps that many keypairs
+generated ahead of time; provisioning a user then only issues the
+self-signed certificate and writes the PKCS#12 file.
+"""
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone, timedelta
+import multiprocessing
+
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization, hashes
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.x509.oid import NameOID
+
+logger = logging.getLogger(__name__)
+
+KEYGEN_WORKERS = max(1, int(os.getenv("KEYGEN_WORKERS", "2")))
+KEY_POOL_SIZE = int(os.getenv("KEY_POOL_SIZE", "0"))
+MAX_KEYS_PER_REQUEST = int(os.getenv("MAX_KEYS_PER_REQUEST", "500"))
+KEY_SIZE = 2048
+CERT_VALID_DAYS = 10
+
+_executor = None
+_executor_lock = threading.Lock()
+_key_pool = None
+_key_pool_lock = threading.Lock()
+
+
+def _generate_private_key_der():
+    """Runs in a pool process; keys are returned as DER since key objects do not pickle"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=KEY_SIZE)
+    return key.private_bytes(
+        serialization.Encoding.DER,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: do not fork gunicorn workers with their sockets and threads
+            _executor = ProcessPoolExecutor(max_workers=KEYGEN_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+class KeyPool(threading.Thread):
+    """Background thread that keeps up to `size` pre-generated private keys ready"""
+
+    def __init__(self, size):
+        super().__init__(daemon=True, name="key-pool")
+        self.keys = queue.Queue(maxsize=size)
+
+    def run(self):
+        while True:
+            try:
+                der = get_executor().submit(_generate_private_key_der).result()
+                self.keys.put(der)  # blocks while the pool is full
+            except Exception as e:
+                logger.error(f"Key pool generation failed: {e}", exc_info=True)
+                threading.Event().wait(5)
+
+    def take(self):
+        try:
+            return self.keys.get_nowait()
+        except queue.Empty:
+            return None
+
+
+def start_key_pool():
+    """
+    Start filling the pre-generated key pool (no-op when KEY_POOL_SIZE is 0).
+    Called on the first key request, so importing app.py (every gunicorn
+    worker, scripts) does not start processes.
+    """
+    global _key_pool
+    with _key_pool_lock:
+        if KEY_POOL_SIZE > 0 and _key_pool is None:
+            _key_pool = KeyPool(KEY_POOL_SIZE)
+            _key_pool.start()
+    return _key_pool
+
+
+def generate_private_keys(count):
+    """Return `count` RSA private keys, taken from the pool first, the rest generated in parallel"""
+    ders = []
+    key_pool = start_key_pool()
+    if key_pool is not None:
+        while len(ders) < count:
+            der = key_pool.take()
+            if der is None:
+                break
+            ders.append(der)
+    futures = [get_executor().submit(_generate_private_key_der) for _ in range(count - len(ders))]
+    ders.extend(future.result() for future in futures)
+    return [serialization.load_der_private_key(der, password=None) for der in ders]
+
+
+def issue_pfx(user_id, user_name, key):
+    """Issue the self-signed certificate for a user and serialize key + cert as encrypted PKCS#12"""
+    from pdf_signing import passphrase_for
+
+    sign_text = user_id + user_name
+    subject = issuer = x509.Name([
+        x509.NameAttribute(NameOID.COMMON_NAME, sign_text),
+    ])
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(issuer)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(datetime.now(timezone.utc))
+        .not_valid_after(datetime.now(timezone.utc) + timedelta(days=CERT_VALID_DAYS))
+        .sign(key, hashes.SHA256())
+    )
+    return pkcs12.serialize_key_and_certificates(
+        f"{user_id}-{user_name}".encode(), key, cert, None,
+        serialization.BestAvailableEncryption(passphrase_for(user_id, user_name).encode())
+    )
+
+
+def provision_keys(users):
+    """
+    Create PFX files for a list of (user_id, user_name) pairs.
+    Existing keys are left alone. Returns one result dict per user, in order.
+    """
+    from pdf_signing import pfx_path_for
+
+    results = [None] * len(users)
+    missing = []
+    for i, (user_id, user_name) in enumerate(users):
+        if os.path.exists(pfx_path_for(user_id, user_name)):
+            results[i] = {"user_id": user_id, "user_name": user_name, "status": "exists",
+                          "key": pfx_path_for(user_id, user_name)}
+        else:
+            missing.append(i)
+
+    keys = generate_private_keys(len(missing))
+    for i, key in zip(missing, keys):
+        user_id, user_name = users[i]
+        pfx_path = pfx_path_for(user_id, user_name)
+        os.makedirs(os.path.dirname(pfx_path) or ".", exist_ok=True)
+        tmp_path = f"{pfx_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(issue_pfx(user_id, user_name, key))
+        os.replace(tmp_path, pfx_path)
+        results[i] = {"user_id": user_id, "user_name": user_name, "status": "created",
+                      "key": os.path.basename(pfx_path)}
+    return results
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Prometheus metrics for the STT pipeline.
+
+prometheus_client is optional: without it every metric below is a no-op stub
+and /metrics answers 501, so instrumented code never needs to check.
+
+Jobs run in the STT service processes while /metrics is served by gunicorn
+workers, so metrics use prometheus_client's multiprocess mode: set
+PROMETHEUS_MULTIPROC_DIR to the same (emptied on restart) directory for
+gunicorn and stt_service.py and every process writes its samples there.
+Queue depths are read from Redis at scrape time.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, multiprocess
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:
+    prometheus_client = None
+
+# Stage durations range from sub-millisecond Redis calls to multi-minute merges
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 4)
+
+
+class _NoopMetric:
+    """Stand-in with the prometheus_client metric API when the library is missing"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, amount):
+        pass
+
+    def set(self, value):
+        pass
+
+
+def _metric(kind, name, documentation, labelnames=(), **kwargs):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return getattr(prometheus_client, kind)(name, documentation, labelnames, **kwargs)
+
+
+JOBS_ENQUEUED = _metric("Counter", "whisper_jobs_enqueued_total", "Jobs pushed to the Redis queues", ["type"])
+JOBS_FINISHED = _metric("Counter", "whisper_jobs_finished_total", "Jobs finished by the workers", ["type", "outcome"])
+JOB_WAIT = _metric("Histogram", "whisper_job_wait_seconds", "Time a job spent queued before a worker took it",
+                   ["type"], buckets=STAGE_BUCKETS)
+JOB_DURATION = _metric("Histogram", "whisper_job_duration_seconds", "Processing time of a job", ["type"],
+                       buckets=STAGE_BUCKETS)
+STAGE_DURATION = _metric("Histogram", "whisper_stage_duration_seconds",
+                         "Duration of one pipeline stage (decode, vad, inference, transcript_log, redis_append, "
+                         "stream_publish, docx_write, merge, pdf_convert)", ["stage"], buckets=STAGE_BUCKETS)
+STT_AUDIO_SECONDS = _metric("Counter", "whisper_stt_audio_seconds_total", "Seconds of audio decoded for STT")
+STT_SKIPPED = _metric("Counter", "whisper_stt_skipped_chunks_total", "Chunks skipped by VAD (no speech)")
+STT_REALTIME_FACTOR = _metric("Histogram", "whisper_stt_realtime_factor",
+                              "Inference time divided by audio duration, per chunk (per batch when batched)",
+                              buckets=RTF_BUCKETS)
+STT_BATCH_SIZE = _metric("Histogram", "whisper_stt_batch_size", "Jobs per STT batch",
+                         buckets=(1, 2, 3, 4, 6, 8, 12, 16, 32))
+MODEL_LOAD = _metric("Histogram", "whisper_model_load_seconds", "Time to load an STT model", ["backend", "model"],
+                     buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300))
+WORKER_BUSY = _metric("Counter", "whisper_worker_busy_seconds_total", "Seconds workers spent processing jobs", ["lane"])
+WORKER_IDLE = _metric("Counter", "whisper_worker_idle_seconds_total", "Seconds workers spent waiting for jobs", ["lane"])
+
+
+@contextmanager
+def stage_timer(stage):
+    """Observe the duration of a block in whisper_stage_duration_seconds{stage=...}"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.labels(stage).observe(time.perf_counter() - started)
+
+
+class QueueCollector:
+    """Scrape-time gauges of the Redis job queues (queued and in-progress jobs per lane)"""
+
+    def __init__(self, redis_client, queues):
+        self.redis = redis_client
+        self.queues = queues  # [(lane, shard, queue_key, processing_key), ...]
+
+    def collect(self):
+        queued = GaugeMetricFamily("whisper_queue_depth", "Jobs waiting in a queue", labels=["lane", "shard"])
+        running = GaugeMetricFamily("whisper_queue_in_progress", "Jobs taken by a worker and not finished",
+                                    labels=["lane", "shard"])
+        pipe = self.redis.pipeline(transaction=False)
+        for _, _, queue_key, processing_key in self.queues:
+            pipe.llen(queue_key)
+            pipe.llen(processing_key)
+        counts = pipe.execute()
+        for i, (lane, shard, _, _) in enumerate(self.queues):
+            queued.add_metric([lane, str(shard)], counts[2 * i])
+            running.add_metric([lane, str(shard)], counts[2 * i + 1])
+        yield queued
+        yield running
+
+
+def render(redis_client=None, queues=()):
+    """Return (body, content_type) for /metrics, or None when prometheus_client is not installed"""
+    if prometheus_client is None:
+        return None
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    body = prometheus_client.generate_latest(registry)
+    if redis_client is not None and queues:
+        queue_registry = CollectorRegistry()
+        queue_registry.register(QueueCollector(redis_client, queues))
+        body += prometheus_client.generate_latest(queue_registry)
+    return body, prometheus_client.CONTENT_TYPE_LATEST
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+DOCX -> PDF conversion with a pool of warm LibreOffice instances.
+
+Each instance is a headless soffice listening on its own local UNO socket
+with its own user profile, so concurrent conversions never share a profile
+and do not pay the LibreOffice cold start per document. Instances are
+started lazily, reused for every conversion and restarted after a failure.
+
+Conversions are queued as "convert_pdf" jobs (see jobs.py) and run by the
+PDF_WORKERS "pdf" lane workers of stt_service.py; worker N owns instance N.
+When the python3-uno bindings are not importable, the instance falls back to
+`soffice --convert-to` with its private profile (cold start, but no clashes).
+"""
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SOFFICE_BIN = os.getenv("SOFFICE_BIN", "soffice")
+SOFFICE_BASE_PORT = int(os.getenv("SOFFICE_BASE_PORT", "2002"))
+SOFFICE_PROFILE_DIR = os.getenv("SOFFICE_PROFILE_DIR", "/tmp/whisper_lo_profiles")
+SOFFICE_START_TIMEOUT = float(os.getenv("SOFFICE_START_TIMEOUT", "60"))
+SOFFICE_CONVERT_TIMEOUT = float(os.getenv("SOFFICE_CONVERT_TIMEOUT", "120"))
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:
+    uno = None
+
+
+def _props(**kwargs):
+    props = []
+    for name, value in kwargs.items():
+        prop = PropertyValue()
+        prop.Name = name
+        prop.Value = value
+        props.append(prop)
+    return tuple(props)
+
+
+def _profile_url(profile_dir):
+    return "file://" + os.path.abspath(profile_dir)
+
+
+class OfficeInstance:
+    """One warm soffice process with a private profile and UNO socket"""
+
+    def __init__(self, index):
+        self.index = index
+        self.port = SOFFICE_BASE_PORT + index
+        self.profile_dir = os.path.join(SOFFICE_PROFILE_DIR, f"instance_{index}")
+        self.proc = None
+        self.desktop = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        cmd = [
+            SOFFICE_BIN, "--headless", "--invisible", "--nologo", "--norestore", "--nodefault",
+            f"-env:UserInstallation={_profile_url(self.profile_dir)}",
+            f"--accept=socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext",
+        ]
+        logger.info(f"Starting LibreOffice instance {self.index} on port {self.port}")
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        local_ctx = uno.getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver", local_ctx)
+        deadline = time.monotonic() + SOFFICE_START_TIMEOUT
+        while True:
+            try:
+                ctx = resolver.resolve(f"uno:socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext")
+                break
+            except Exception:
+                if self.proc.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError(f"LibreOffice instance {self.index} did not start")
+                time.sleep(0.25)
+        self.desktop = ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+        logger.info(f"LibreOffice instance {self.index} ready")
+
+    def stop(self):
+        self.desktop = None
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.proc = None
+
+    def is_alive(self):
+        return self.desktop is not None and self.proc is not None and self.proc.poll() is None
+
+    def convert(self, docx_path, pdf_path):
+        """Convert docx_path to pdf_path; the PDF appears atomically when done"""
+        tmp_pdf = os.path.join(os.path.dirname(os.path.abspath(pdf_path)), f".{uuid.uuid4().hex}.pdf")
+        with self.lock:
+            try:
+                if uno is None:
+                    self._convert_cli(docx_path, tmp_pdf)
+                else:
+                    self._convert_uno(docx_path, tmp_pdf)
+                os.replace(tmp_pdf, pdf_path)
+                return pdf_path
+            finally:
+                if os.path.exists(tmp_pdf):
+                    os.remove(tmp_pdf)
+
+    def _convert_uno(self, docx_path, out_pdf):
+        for attempt in (1, 2):
+            try:
+                if not self.is_alive():
+                    self.stop()
+                    self.start()
+                doc = self.desktop.loadComponentFromURL(
+                    uno.systemPathToFileUrl(os.path.abspath(docx_path)), "_blank", 0,
+                    _props(Hidden=True, ReadOnly=True),
+                )
+                try:
+                    doc.storeToURL(uno.systemPathToFileUrl(os.path.abspath(out_pdf)), _props(FilterName="writer_pdf_Export"))
+                finally:
+                    doc.close(True)
+                return
+            except Exception as e:
+                logger.warning(f"LibreOffice instance {self.index} failed (attempt {attempt}): {e}")
+                self.stop()
+                if attempt == 2:
+                    raise RuntimeError(f"PDF conversion failed: {e}")
+
+    def _convert_cli(self, docx_path, out_pdf):
+        # Convert into a private directory next to out_pdf: the rename below then
+        # stays on one filesystem (the profile dir may be on another one) and
+        # readers never see a half-written PDF
+        outdir = tempfile.mkdtemp(prefix=".soffice-", dir=os.path.dirname(os.path.abspath(out_pdf)))
+        try:
+            cmd = [
+                SOFFICE_BIN, "--headless", f"-env:UserInstallation={_profile_url(self.profile_dir)}",
+                "--convert-to", "pdf", "--outdir", outdir, docx_path,
+            ]
+            subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                           timeout=SOFFICE_CONVERT_TIMEOUT, check=True)
+            produced = os.path.join(outdir, os.path.splitext(os.path.basename(docx_path))[0] + ".pdf")
+            if not os.path.exists(produced):
+                raise RuntimeError("LibreOffice did not produce a PDF")
+            os.replace(produced, out_pdf)
+        finally:
+            shutil.rmtree(outdir, ignore_errors=True)
+
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_instance(index):
+    with _instances_lock:
+        if index not in _instances:
+            _instances[index] = OfficeInstance(index)
+        return _instances[index]
+
+
+def convert_docx_to_pdf(docx_path, pdf_path, instance=0):
+    """Convert with the given pool instance (one instance per pdf lane worker)"""
+    return get_instance(instance).convert(docx_path, pdf_path)
+
+
+def shutdown():
+    with _instances_lock:
+        for instance in _instances.values():
+            instance.stop()
+        _instances.clear()
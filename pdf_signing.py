@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+PDF signing helpers: an in-memory cache of loaded PKCS#12 signers and
+in-memory incremental signing.
+
+SimpleSigner.load_pkcs12 decrypts the .pfx (PBKDF) and parses the RSA key on
+every call. When a meeting ends many participants sign at once, so loaded
+signers are kept for SIGNER_CACHE_TTL seconds (LRU, at most SIGNER_CACHE_MAX
+entries) and can be evicted explicitly, e.g. when a key is replaced.
+"""
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+from pyhanko.sign import fields, signers
+from pyhanko.sign.fields import SigFieldSpec
+from pyhanko.stamp import TextStampStyle
+
+KEYS_DIR = os.getenv("KEYS_DIR", "keys")
+SIGNER_CACHE_TTL = int(os.getenv("SIGNER_CACHE_TTL", "900"))
+SIGNER_CACHE_MAX = int(os.getenv("SIGNER_CACHE_MAX", "256"))
+
+
+def pfx_path_for(user_id, user_name):
+    return os.path.join(KEYS_DIR, f"{user_id}-{user_name}.pfx")
+
+
+def passphrase_for(user_id, user_name):
+    return f"actvn@edu.vn{user_id}-{user_name}"
+
+
+class SignerCache:
+    """Thread-safe TTL + LRU cache of pyhanko SimpleSigner objects, keyed by PFX file"""
+
+    def __init__(self, ttl=SIGNER_CACHE_TTL, max_entries=SIGNER_CACHE_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, pfx_file, passphrase):
+        """Return a signer for pfx_file, loading and decrypting it only on a miss"""
+        # mtime and passphrase are part of the key: a replaced file or a
+        # different passphrase never reuses a stale signer
+        key = (
+            os.path.abspath(pfx_file),
+            os.path.getmtime(pfx_file),
+            hashlib.sha256(passphrase.encode()).hexdigest(),
+        )
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                return entry[0]
+
+        signer = signers.SimpleSigner.load_pkcs12(pfx_file=pfx_file, passphrase=passphrase.encode())
+        if signer is None:
+            raise RuntimeError(f"Không thể load key {pfx_file}")
+
+        with self._lock:
+            self._entries[key] = (signer, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return signer
+
+    def evict(self, pfx_file=None):
+        """Drop the signer(s) of one PFX file, or everything when pfx_file is None. Returns the count."""
+        with self._lock:
+            if pfx_file is None:
+                count = len(self._entries)
+                self._entries.clear()
+                return count
+            path = os.path.abspath(pfx_file)
+            stale = [key for key in self._entries if key[0] == path]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+
+signer_cache = SignerCache()
+
+
+def signature_box(index):
+    """Position of the index-th signature stamp on the first page (two columns)"""
+    x = 100 + (index % 2) * 220
+    y = 100 + (index // 2) * 60
+    return (x, y, x + 200, y + 50)
+
+
+def sign_pdf_bytes(pdf_bytes, signer, label, field_name="SignatureVisible", box=(100, 100, 300, 150)):
+    """Append one visible signature as an incremental update; returns the signed PDF bytes"""
+    w = IncrementalPdfFileWriter(io.BytesIO(pdf_bytes))
+
+    stamp_style = TextStampStyle(
+        stamp_text=f'Digital Signed by: {label}\nDate: %(ts)s',
+        background=None,
+        border_width=1
+    )
+
+    fields.append_signature_field(w, SigFieldSpec(field_name, box=box, on_page=0))
+
+    pdf_signer = signers.PdfSigner(
+        signers.PdfSignatureMetadata(field_name=field_name),
+        signer=signer,
+        stamp_style=stamp_style
+    )
+
+    out = io.BytesIO()
+    pdf_signer.sign_pdf(w, output=out)
+    return out.getvalue()
+
+
+def sign_pdf_batch(pdf_bytes, users):
+    """
+    Apply the signatures of several (user_id, user_name) pairs in sequence.
+    Each signature is an incremental update on the previous in-memory result,
+    so the file is read once and every earlier signature stays valid.
+    """
+    for index, (user_id, user_name) in enumerate(users):
+        signer = signer_cache.get(pfx_path_for(user_id, user_name), passphrase_for(user_id, user_name))
+        pdf_bytes = sign_pdf_bytes(
+            pdf_bytes, signer, f"{user_id}-{user_name}",
+            field_name=f"Signature_{user_id}", box=signature_box(index),
+        )
+    return pdf_bytes
@@ -1,4 +1,12 @@
 pkill -f "gunicorn.*app:app"
+pkill -f "python stt_service.py"
 sleep 2
-nohup gunicorn -w 2 -b 127.0.0.1:5000 app:app > gunicorn.log 2>&1 &
-tail -f gunicorn.log
\ No newline at end of file
+# Shared by gunicorn and stt_service.py for /metrics (emptied on every restart)
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/whisper_metrics}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+nohup python stt_service.py > stt_service.log 2>&1 &
+# Each /api/transcript_stream viewer holds one of the 2 x 32 threads for up to SSE_MAX_SECONDS;
+# SSE_MAX_STREAMS (default 16) per worker keeps half of them free for the other APIs.
+# More viewers: raise --threads and SSE_MAX_STREAMS together, or add workers (-w).
+nohup gunicorn -w 2 -k gthread --threads 32 -b 127.0.0.1:5000 app:app > gunicorn.log 2>&1 &
+tail -f gunicorn.log
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Pluggable speech-to-text backends.
+
+Every backend takes 16 kHz mono float32 audio (or a file path) and returns
+plain text in the same form as whisper's model.transcribe(...)["text"], so
+the transcript store does not care which engine produced it.
+
+Configuration (environment):
+    STT_BACKEND        whisper | whisper-int8 | faster-whisper   (default: whisper)
+    STT_MODEL          model size, e.g. base, small, medium      (default: medium)
+    STT_COMPUTE_TYPE   CTranslate2 compute type for faster-whisper (default: int8)
+    STT_THREADS        CPU threads per backend, 0 = library default
+    STT_TIERS          quality tier -> model size, e.g. "draft=base,final=medium"
+                       (default: draft=base, final=STT_MODEL)
+    STT_DEFAULT_TIER   tier of chunks uploaded without one        (default: final)
+    STT_PRELOAD_TIERS  tiers loaded and warmed up at service start (default: STT_DEFAULT_TIER)
+    STT_MAX_MODELS     model sizes kept resident per process, least recently
+                       used is evicted                            (default: 2)
+    STT_WARMUP         1 = run one inference on silence after loading a model (default: 1)
+"""
+import gc
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import MODEL_LOAD
+
+logger = logging.getLogger(__name__)
+
+STT_BACKEND = os.getenv("STT_BACKEND", "whisper")
+STT_MODEL_NAME = os.getenv("STT_MODEL", "medium")
+STT_COMPUTE_TYPE = os.getenv("STT_COMPUTE_TYPE", "int8")
+STT_THREADS = int(os.getenv("STT_THREADS", "0"))
+STT_TIERS = dict(
+    item.split("=", 1) for item in os.getenv("STT_TIERS", f"draft=base,final={STT_MODEL_NAME}").split(",") if "=" in item
+)
+STT_DEFAULT_TIER = os.getenv("STT_DEFAULT_TIER", "final")
+STT_PRELOAD_TIERS = [t for t in os.getenv("STT_PRELOAD_TIERS", STT_DEFAULT_TIER).split(",") if t]
+STT_MAX_MODELS = max(1, int(os.getenv("STT_MAX_MODELS", "2")))
+STT_WARMUP = os.getenv("STT_WARMUP", "1") == "1"
+
+
+class SttBackend:
+    """Interface of an STT engine"""
+    name = "base"
+
+    def __init__(self, model_size):
+        self.model_size = model_size
+
+    def load_audio(self, filepath):
+        """Decode a file to 16 kHz mono float32"""
+        raise NotImplementedError
+
+    def transcribe(self, audio):
+        """Transcribe one clip (array or path) and return its text"""
+        raise NotImplementedError
+
+    def transcribe_batch(self, audios):
+        """Transcribe several clips; backends without batching run them one by one"""
+        return [self.transcribe(audio) for audio in audios]
+
+
+class WhisperBackend(SttBackend):
+    """openai-whisper on PyTorch, optionally with INT8 dynamic quantization of Linear layers"""
+    name = "whisper"
+
+    def __init__(self, model_size, quantize=False, threads=0):
+        super().__init__(model_size)
+        import torch
+        import whisper
+
+        if threads:
+            torch.set_num_threads(threads)
+
+        device = "cuda" if torch.cuda.is_available() and not quantize else "cpu"
+        self.model = whisper.load_model(model_size, device=device)
+
+        if quantize:
+            # whisper.model.Linear only casts dtypes in forward(); on CPU/FP32
+            # it is a plain nn.Linear, which quantize_dynamic knows how to swap.
+            for module in self.model.modules():
+                if isinstance(module, whisper.model.Linear):
+                    module.__class__ = torch.nn.Linear
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            self.name = "whisper-int8"
+
+        self.fp16 = self.model.device.type == "cuda"
+
+    def load_audio(self, filepath):
+        import whisper
+        return whisper.load_audio(filepath)
+
+    def transcribe(self, audio):
+        return self.model.transcribe(audio, fp16=self.fp16)["text"]
+
+    def transcribe_batch(self, audios):
+        """
+        Transcribe several clips with one batched encoder/decoder pass.
+
+        Clips that fit in Whisper's 30 s window are padded, stacked into a single
+        mel batch and decoded together. Longer clips need the sliding-window logic
+        of model.transcribe and are handled one by one. Returns texts in input order.
+        """
+        import torch
+        import whisper
+        from whisper.audio import N_SAMPLES
+
+        model = self.model
+        texts = [None] * len(audios)
+        mels, batch_index = [], []
+        mel_kwargs = {"n_mels": model.dims.n_mels} if model.dims.n_mels != 80 else {}
+
+        for i, audio in enumerate(audios):
+            if isinstance(audio, str):
+                audio = self.load_audio(audio)
+            if len(audio) > N_SAMPLES:
+                texts[i] = self.transcribe(audio)
+                continue
+            mels.append(whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), **mel_kwargs))
+            batch_index.append(i)
+
+        if mels:
+            mel_batch = torch.stack(mels).to(model.device)
+            options = whisper.DecodingOptions(fp16=self.fp16)
+            for i, decoded in zip(batch_index, whisper.decode(model, mel_batch, options)):
+                # Same silence rule as model.transcribe (no_speech_threshold / logprob_threshold)
+                if decoded.no_speech_prob > 0.6 and decoded.avg_logprob < -1.0:
+                    texts[i] = ""
+                else:
+                    texts[i] = decoded.text
+        return texts
+
+
+class FasterWhisperBackend(SttBackend):
+    """faster-whisper (CTranslate2) with quantized weights, e.g. compute_type=int8 on CPU"""
+    name = "faster-whisper"
+
+    def __init__(self, model_size, compute_type="int8", threads=0):
+        super().__init__(model_size)
+        from faster_whisper import WhisperModel
+        self.compute_type = compute_type
+        self.model = WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=threads)
+
+    def load_audio(self, filepath):
+        from faster_whisper import decode_audio
+        return decode_audio(filepath, sampling_rate=16000)
+
+    def transcribe(self, audio):
+        segments, _ = self.model.transcribe(audio, beam_size=5)
+        # Segment texts keep their leading space, like whisper's joined "text"
+        return "".join(segment.text for segment in segments)
+
+
+def create_backend(backend=None, model_size=None, compute_type=None, threads=None):
+    """Build an STT backend; unspecified options come from the environment"""
+    backend = backend or STT_BACKEND
+    model_size = model_size or STT_MODEL_NAME
+    threads = STT_THREADS if threads is None else threads
+
+    logger.info(f"Loading STT backend '{backend}' with model '{model_size}'...")
+    if backend == "whisper":
+        return WhisperBackend(model_size, threads=threads)
+    if backend == "whisper-int8":
+        return WhisperBackend(model_size, quantize=True, threads=threads)
+    if backend == "faster-whisper":
+        return FasterWhisperBackend(model_size, compute_type=compute_type or STT_COMPUTE_TYPE, threads=threads)
+    raise ValueError(f"Unknown STT backend: {backend}")
+
+
+def model_for_tier(tier=None):
+    """Model size of a quality tier; unknown or missing tiers use STT_DEFAULT_TIER"""
+    if tier and tier not in STT_TIERS:
+        logger.warning(f"Unknown STT tier '{tier}', using '{STT_DEFAULT_TIER}'")
+    return STT_TIERS.get(tier) or STT_TIERS.get(STT_DEFAULT_TIER) or STT_MODEL_NAME
+
+
+def warm_up(backend):
+    """Run one inference on a second of silence so the first real chunk does not pay for lazy init"""
+    import numpy as np
+
+    started = time.perf_counter()
+    try:
+        backend.transcribe(np.zeros(16000, dtype=np.float32))
+    except Exception as e:
+        logger.warning(f"Warm-up of STT model '{backend.model_size}' failed: {str(e)}")
+        return
+    logger.info(f"STT model '{backend.model_size}' warmed up in {time.perf_counter() - started:.2f}s")
+
+
+def _release_memory():
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class ModelRegistry:
+    """
+    Per-process cache of loaded backends, keyed by model size.
+
+    Models are loaded (and warmed up) on first use. When a new size is needed
+    and max_models are already resident, the least recently used one is
+    dropped first so peak memory stays bounded.
+    """
+
+    def __init__(self, max_models=STT_MAX_MODELS, warmup=STT_WARMUP):
+        self.max_models = max_models
+        self.warmup = warmup
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model_size=None):
+        model_size = model_size or STT_MODEL_NAME
+        with self._lock:
+            backend = self._models.get(model_size)
+            if backend is not None:
+                self._models.move_to_end(model_size)
+                return backend
+
+            while len(self._models) >= self.max_models:
+                # Keep no reference to the evicted backend, so it is freed before the new one loads
+                evicted = next(iter(self._models))
+                del self._models[evicted]
+                logger.info(f"Evicting STT model '{evicted}' to load '{model_size}'")
+                _release_memory()
+
+            started = time.perf_counter()
+            backend = create_backend(model_size=model_size)
+            MODEL_LOAD.labels(backend.name, backend.model_size).observe(time.perf_counter() - started)
+            logger.info(f"STT backend loaded: {backend.name} ({backend.model_size})")
+            if self.warmup:
+                warm_up(backend)
+            self._models[model_size] = backend
+            return backend
+
+    def for_tier(self, tier=None):
+        return self.get(model_for_tier(tier))
+
+    def add(self, model_size, backend):
+        """Register an already built backend (e.g. a stand-in for benchmarks)"""
+        with self._lock:
+            self._models[model_size] = backend
+            self._models.move_to_end(model_size)
+
+    def loaded(self):
+        return list(self._models)
+
+
+# Shared by the STT workers (jobs.get_stt_backend) and utils.transcribe_with_whisper
+registry = ModelRegistry()
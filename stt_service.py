@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Standalone STT inference service.
+
+This process consumes the jobs that app.py pushes to Redis (see
+jobs.enqueue_job). The gunicorn workers only save uploads and enqueue work,
+so they start fast and hold no model weights.
+
+- STT lane: STT_WORKERS child processes, each owning its own STT models (one
+  per quality tier in use, see stt_backends.ModelRegistry) and one shard of
+  the STT queue. Chunks of a meeting always go to the same shard, so they
+  are transcribed in order; different meetings run in parallel.
+- Merge lane: MERGE_WORKERS threads in this process. Merges never wait behind
+  STT work and never hold it up, and they do not need the model. Chunk
+  decoding is fanned out over MERGE_DECODE_WORKERS processes (see
+  utils.iter_decoded_chunks).
+- PDF lane: PDF_WORKERS threads, each owning one warm LibreOffice instance
+  (see pdf_service.py).
+
+Usage:
+    STT_WORKERS=2 MERGE_WORKERS=1 PDF_WORKERS=2 python stt_service.py
+"""
+import logging
+import multiprocessing
+import signal
+import threading
+
+import pdf_service
+import utils
+from jobs import JobWorker, get_stt_backend, STT_WORKERS, MERGE_WORKERS, PDF_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for crashed STT worker processes
+MONITOR_INTERVAL = 5
+
+
+def run_stt_worker(shard):
+    """Entry point of one STT worker process"""
+    logging.basicConfig(level=logging.INFO)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Load and warm up the preloaded tiers before taking jobs so the first chunk is not delayed;
+    # other tiers load on first use
+    from stt_backends import STT_PRELOAD_TIERS
+    for tier in STT_PRELOAD_TIERS:
+        get_stt_backend(tier)
+
+    worker = JobWorker(lane="stt", shard=shard)
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    worker.run()
+
+
+def main():
+    # spawn: children must not inherit the parent's Redis sockets
+    ctx = multiprocessing.get_context("spawn")
+    stop_event = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, stopping STT service...")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    def start_stt_process(shard):
+        proc = ctx.Process(target=run_stt_worker, args=(shard,), name=f"stt-worker-{shard}", daemon=True)
+        proc.start()
+        return proc
+
+    stt_processes = {shard: start_stt_process(shard) for shard in range(STT_WORKERS)}
+
+    lane_workers = [JobWorker(lane="merge", shard=shard) for shard in range(MERGE_WORKERS)]
+    lane_workers += [JobWorker(lane="pdf", shard=shard) for shard in range(PDF_WORKERS)]
+    for worker in lane_workers:
+        worker.start()
+
+    logger.info(f"🚀 STT service ready: {STT_WORKERS} STT process(es), "
+                f"{MERGE_WORKERS} merge worker(s), {PDF_WORKERS} PDF worker(s)")
+
+    while not stop_event.wait(MONITOR_INTERVAL):
+        for shard, proc in stt_processes.items():
+            if not proc.is_alive():
+                logger.error(f"STT worker {shard} exited with code {proc.exitcode}, restarting...")
+                stt_processes[shard] = start_stt_process(shard)
+
+    for worker in lane_workers:
+        worker.stop()
+    for proc in stt_processes.values():
+        proc.terminate()
+    for proc in stt_processes.values():
+        proc.join(timeout=10)
+    for worker in lane_workers:
+        worker.join(timeout=5)
+    pdf_service.shutdown()
+    utils.shutdown_merge_executor()
+    logger.info("STT service stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import gc
+import weakref
+
+import stt_backends
+
+
+class FakeBackend(stt_backends.SttBackend):
+    name = "fake"
+
+    def transcribe(self, audio):
+        return ""
+
+
+def test_evicted_model_is_freed_before_the_next_one_loads(monkeypatch):
+    created = []
+    alive_at_load = []
+
+    def create_backend(model_size=None, **kwargs):
+        gc.collect()
+        alive_at_load.append([ref().model_size for ref in created if ref() is not None])
+        backend = FakeBackend(model_size)
+        created.append(weakref.ref(backend))
+        return backend
+
+    monkeypatch.setattr(stt_backends, "create_backend", create_backend)
+    registry = stt_backends.ModelRegistry(max_models=1, warmup=False)
+
+    registry.get("base")
+    registry.get("medium")
+
+    assert alive_at_load == [[], []]
+    assert registry.loaded() == ["medium"]
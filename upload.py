@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming ingest of audio chunks.
+
+/api/stt_input goes through Flask's multipart parser, which spools large
+files to a temporary file, and then copies that file again with f.save().
+The functions here write the request body straight into the meeting's
+chunks directory instead: a hidden ".<uuid>.part" file that is renamed to
+its final chunk name (same directory, no copy) once the size and format
+checks passed. Listings and merges ignore dot files, so a half-written chunk
+is never picked up.
+
+Two upload shapes are supported:
+- a raw request body holding one chunk (Content-Type: audio/*), and
+- multipart/form-data with several "file" parts; every part is streamed
+  into its own file by a stream factory, not into a temporary spool.
+
+Upload sessions keep the per-speaker metadata (meeting, user, name, role) in
+Redis so each chunk request only carries its timestamp.
+"""
+import logging
+import os
+import uuid
+
+from werkzeug.formparser import parse_form_data
+
+from utils import r, AUDIO_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+MAX_CHUNK_BYTES = int(os.getenv("MAX_CHUNK_BYTES", str(50 * 1024 * 1024)))
+MAX_CHUNKS_PER_REQUEST = int(os.getenv("MAX_CHUNKS_PER_REQUEST", "32"))
+UPLOAD_BLOCK_SIZE = 64 * 1024
+UPLOAD_SESSION_PREFIX = "stt-upload"
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(6 * 3600)))
+
+# Leading bytes of the audio containers the recorders send
+AUDIO_SIGNATURES = (
+    (b"RIFF", ".wav"),
+    (b"OggS", ".ogg"),
+    (b"fLaC", ".flac"),
+    (b"ID3", ".mp3"),
+    (b"\x1a\x45\xdf\xa3", ".webm"),
+)
+SNIFF_BYTES = 12
+
+
+class UploadError(Exception):
+    """Rejected upload; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def sniff_audio_format(head):
+    """Return the file extension for the first bytes of an audio file, or None if unknown"""
+    if head[:4] == b"RIFF" and head[8:12] != b"WAVE":
+        return None
+    for signature, ext in AUDIO_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[4:8] == b"ftyp":
+        return ".m4a"
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return ".mp3"  # MPEG frame sync without ID3 tag
+    return None
+
+
+def chunk_filename(ts_str, user_id, ext):
+    # Containers outside AUDIO_EXTENSIONS (webm) keep the .wav name stt_input has always used
+    if ext not in AUDIO_EXTENSIONS:
+        ext = ".wav"
+    return f"{ts_str}__{user_id}__{uuid.uuid4().hex}{ext}"
+
+
+class ChunkWriter:
+    """File-like sink that enforces MAX_CHUNK_BYTES while data is written"""
+
+    def __init__(self, chunks_dir):
+        self.tmp_path = os.path.join(chunks_dir, f".{uuid.uuid4().hex}.part")
+        self.file = open(self.tmp_path, "w+b")
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > MAX_CHUNK_BYTES:
+            raise UploadError(f"chunk exceeds {MAX_CHUNK_BYTES} bytes", 413)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        # seek/read/flush/... for werkzeug's FileStorage
+        if name == "file":
+            raise AttributeError(name)
+        return getattr(self.file, name)
+
+    def commit(self, ts_str, user_id):
+        """Validate the format and rename the part file to its chunk name; returns the final path"""
+        self.file.flush()
+        self.file.seek(0)
+        head = self.file.read(SNIFF_BYTES)
+        self.file.close()
+        if self.size == 0:
+            raise UploadError("empty chunk")
+        ext = sniff_audio_format(head)
+        if ext is None:
+            raise UploadError("unsupported audio format", 415)
+        path = os.path.join(os.path.dirname(self.tmp_path), chunk_filename(ts_str, user_id, ext))
+        os.replace(self.tmp_path, path)
+        return path
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def receive_raw_chunk(stream, content_length, chunks_dir, ts_str, user_id):
+    """Stream a raw request body into the chunks directory; returns the chunk path"""
+    if content_length is not None and content_length > MAX_CHUNK_BYTES:
+        raise UploadError(f"chunk exceeds {MAX_CHUNK_BYTES} bytes", 413)
+    writer = ChunkWriter(chunks_dir)
+    try:
+        while True:
+            block = stream.read(UPLOAD_BLOCK_SIZE)
+            if not block:
+                break
+            writer.write(block)
+        return writer.commit(ts_str, user_id)
+    except BaseException:
+        writer.discard()
+        raise
+
+
+def receive_multipart_chunks(environ, chunks_dir):
+    """
+    Parse a multipart body whose "file" parts are streamed straight into the
+    chunks directory. Returns (form, writers) with one ChunkWriter per part,
+    in request order; the caller commits or discards them.
+    """
+    writers = []
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        if len(writers) >= MAX_CHUNKS_PER_REQUEST:
+            raise UploadError(f"at most {MAX_CHUNKS_PER_REQUEST} chunks per request", 413)
+        writer = ChunkWriter(chunks_dir)
+        writers.append(writer)
+        return writer
+
+    try:
+        _, form, files = parse_form_data(
+            environ, stream_factory=stream_factory, silent=False,
+            max_content_length=MAX_CHUNK_BYTES * MAX_CHUNKS_PER_REQUEST,
+        )
+    except BaseException:
+        for writer in writers:
+            writer.discard()
+        raise
+    # Parts under another field name are not chunks
+    chunk_writers = [f.stream for f in files.getlist("file")]
+    for writer in writers:
+        if writer not in chunk_writers:
+            writer.discard()
+    return form, chunk_writers
+
+
+def session_key(session_id):
+    return f"{UPLOAD_SESSION_PREFIX}:{session_id}"
+
+
+def create_session(meeting_id, user_id, full_name="", role="", quality=""):
+    """Open an upload session for one speaker of a meeting (quality = STT tier, "" = default); returns its id"""
+    session_id = uuid.uuid4().hex
+    pipe = r.pipeline()
+    pipe.hset(session_key(session_id), mapping={
+        "meeting_id": meeting_id,
+        "user_id": user_id,
+        "full_name": full_name,
+        "role": role,
+        "quality": quality,
+        "chunks": 0,
+    })
+    pipe.expire(session_key(session_id), UPLOAD_SESSION_TTL)
+    pipe.execute()
+    return session_id
+
+
+def get_session(session_id):
+    """Session metadata (TTL is refreshed on every use), or None if unknown or expired"""
+    pipe = r.pipeline()
+    pipe.hgetall(session_key(session_id))
+    pipe.expire(session_key(session_id), UPLOAD_SESSION_TTL)
+    data, _ = pipe.execute()
+    if not data:
+        return None
+    return {k.decode(): v.decode() for k, v in data.items()}
+
+
+def count_session_chunks(session_id, count):
+    return r.hincrby(session_key(session_id), "chunks", count)
+
+
+def close_session(session_id):
+    return bool(r.delete(session_key(session_id)))
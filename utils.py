@@ -1,42 +1,158 @@
 # -*- coding: utf-8 -*-
-import os, json, hashlib, shutil, wave, time
+import os, json, hashlib, time, threading, multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from redis import Redis
+from contextlib import contextmanager
 from datetime import datetime
 from docx import Document
 from pydub import AudioSegment
+from metrics import stage_timer
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 r = Redis.from_url(REDIS_URL)
 MEETINGS_DIR = os.getenv("MEETINGS_DIR", "meetings")
 
-# Global model cache
-_whisper_model = None
+def get_whisper_model(model_name=None):
+    """
+    Get cached STT backend (see stt_backends) to avoid reloading every time.
+    Shares the STT service's model registry, so each size is loaded once per process.
+    """
+    try:
+        from stt_backends import registry
+        return registry.get(model_name)
+    except Exception as e:
+        raise RuntimeError("Failed to load whisper model: " + str(e))
+
+AUDIO_EXTENSIONS = ('.wav', '.ogg', '.mp3', '.m4a', '.flac', '.opus')
+
+# Merges read the 16 kHz mono decode shared with STT (see audio_cache) instead
+# of running ffmpeg on every chunk again. 0 = decode the original files, which
+# keeps their sample rate and channels in the merged recording.
+MERGE_FROM_PCM = os.getenv("MERGE_FROM_PCM", "1") == "1"
+
+def load_chunk_audio(fpath):
+    """Decoded chunk for the merges, as a pydub AudioSegment"""
+    if MERGE_FROM_PCM:
+        import audio_cache
+        return audio_cache.load_segment(fpath)
+    return AudioSegment.from_file(fpath)
+
+# Chunk decoding (ffmpeg + resampling) for the merges is fanned out over a
+# process pool shared by the merge workers of this process. 1 = decode inline.
+MERGE_DECODE_WORKERS = max(1, int(os.getenv("MERGE_DECODE_WORKERS", str(max(1, (os.cpu_count() or 2) // 2)))))
+_merge_executor = None
+_merge_executor_lock = threading.Lock()
+
+def get_merge_executor():
+    global _merge_executor
+    with _merge_executor_lock:
+        if _merge_executor is None:
+            # spawn: children must not inherit the parent's Redis sockets and threads
+            _merge_executor = ProcessPoolExecutor(max_workers=MERGE_DECODE_WORKERS,
+                                                  mp_context=multiprocessing.get_context("spawn"))
+        return _merge_executor
+
+def shutdown_merge_executor():
+    global _merge_executor
+    with _merge_executor_lock:
+        if _merge_executor is not None:
+            _merge_executor.shutdown(cancel_futures=True)
+            _merge_executor = None
+
+def _discard_merge_executor(executor):
+    """Forget a broken pool so the next merge starts a new one"""
+    global _merge_executor
+    with _merge_executor_lock:
+        if _merge_executor is executor:
+            _merge_executor = None
+
+def _decode_chunk_for_merge(fpath, target=None):
+    """
+    Pool task: decode one chunk. With MERGE_FROM_PCM this only fills the
+    shared PCM cache (the parent then memory-maps it, nothing is pickled back);
+    otherwise returns the raw frames, converted to target=(frame_rate, channels).
+    """
+    if MERGE_FROM_PCM:
+        import audio_cache
+        audio_cache.ensure_pcm(fpath)
+        return None
+    audio = AudioSegment.from_file(fpath)
+    if target is not None:
+        if audio.frame_rate != target[0]:
+            audio = audio.set_frame_rate(target[0])
+        if audio.channels != target[1]:
+            audio = audio.set_channels(target[1])
+    return audio.raw_data, audio.sample_width, audio.frame_rate, audio.channels
+
+def _merge_segment(fpath, decoded):
+    if decoded is None:
+        return load_chunk_audio(fpath)
+    data, sample_width, frame_rate, channels = decoded
+    return AudioSegment(data=data, sample_width=sample_width, frame_rate=frame_rate, channels=channels)
 
-def get_whisper_model(model_name="medium"):
+def iter_decoded_chunks(fpaths, target=None):
     """
-    Get cached Whisper model to avoid reloading every time
+    Decode chunks on the merge process pool and yield (fpath, AudioSegment, error)
+    in input order; audio is None when decoding failed. At most
+    2 x MERGE_DECODE_WORKERS chunks are in flight, so memory stays bounded.
+
+    target=(frame_rate, channels) makes the workers resample to it too; when it
+    is None the format of the first decoded chunk is used for the rest.
     """
-    global _whisper_model
-    if _whisper_model is None:
+    if MERGE_FROM_PCM:
+        import audio_cache
+        target = (audio_cache.SAMPLE_RATE, 1)
+    executor = get_merge_executor() if MERGE_DECODE_WORKERS > 1 else None
+    window = deque()
+    next_index = 0
+    while next_index < len(fpaths) or window:
+        # Until the target format is known only one chunk is decoded at a time
+        while (executor is not None and next_index < len(fpaths) and len(window) < 2 * MERGE_DECODE_WORKERS
+               and (target is not None or not window)):
+            fpath = fpaths[next_index]
+            try:
+                window.append((fpath, executor.submit(_decode_chunk_for_merge, fpath, target)))
+            except BrokenProcessPool:
+                _discard_merge_executor(executor)
+                executor = None
+                break
+            next_index += 1
+        if window:
+            fpath, future = window.popleft()
+        else:
+            fpath, future = fpaths[next_index], None
+            next_index += 1
         try:
-            import whisper
-            print(f"Loading Whisper model '{model_name}'...")
-            _whisper_model = whisper.load_model(model_name)
-            print(f"Model loaded successfully!")
+            try:
+                decoded = future.result() if future is not None else _decode_chunk_for_merge(fpath, target)
+            except BrokenProcessPool:
+                # A worker died: decode the rest of this merge here, later merges get a new pool
+                _discard_merge_executor(executor)
+                executor = None
+                decoded = _decode_chunk_for_merge(fpath, target)
+            audio = _merge_segment(fpath, decoded)
         except Exception as e:
-            raise RuntimeError("Failed to load whisper model: " + str(e))
-    return _whisper_model
+            yield fpath, None, e
+            continue
+        if target is None:
+            target = (audio.frame_rate, audio.channels)
+        yield fpath, audio, None
 
-def merge_audio_chunks_direct(chunks_dir, out_path, log_file=None):
+def extract_timestamp(filename):
     """
-    Merge all audio files (.wav, .ogg, .m4a, etc.) directly to OGG format using pydub.
-    This avoids ffmpeg concat issues with opus codec.
-    
-    Args:
-        chunks_dir: Directory containing audio chunks
-        out_path: Output file path (should end with .ogg)
-        log_file: Optional log file path to write detailed logs
+    Parse the dd-mm-yyyy_HH-MM-SS prefix of a chunk filename.
+    Files without a valid prefix sort first.
     """
+    try:
+        date_part = filename.split("__")[0]
+        return datetime.strptime(date_part, "%d-%m-%Y_%H-%M-%S")
+    except Exception:
+        return datetime.min
+
+def make_log_msg(log_file=None):
+    """Return a logger that prints and optionally appends to log_file"""
     def log_msg(msg):
         print(msg)
         if log_file:
@@ -46,6 +162,20 @@ def merge_audio_chunks_direct(chunks_dir, out_path, log_file=None):
                     f.flush()
             except:
                 pass
+    return log_msg
+
+def merge_audio_chunks_direct(chunks_dir, out_path, log_file=None):
+    """
+    Merge all audio files (.wav, .ogg, .m4a, etc.) directly to OGG format using pydub.
+    This avoids ffmpeg concat issues with opus codec. Chunks are decoded on
+    MERGE_DECODE_WORKERS processes and concatenated in timestamp order.
+    
+    Args:
+        chunks_dir: Directory containing audio chunks
+        out_path: Output file path (should end with .ogg)
+        log_file: Optional log file path to write detailed logs
+    """
+    log_msg = make_log_msg(log_file)
     
     if not os.path.exists(chunks_dir):
         raise RuntimeError("Audio chunks directory does not exist")
@@ -53,21 +183,13 @@ def merge_audio_chunks_direct(chunks_dir, out_path, log_file=None):
     # Get all audio files
     audio_files = []
     for f in os.listdir(chunks_dir):
-        if f.lower().endswith(('.wav', '.ogg', '.mp3', '.m4a', '.flac', '.opus')):
+        if f.lower().endswith(AUDIO_EXTENSIONS):
             audio_files.append(f)
     
     if not audio_files:
         raise RuntimeError("No audio chunks to merge")
     
     # Sort by timestamp
-    def extract_timestamp(filename):
-        try:
-            date_part = filename.split("__")[0]
-            dt = datetime.strptime(date_part, "%d-%m-%Y_%H-%M-%S")
-            return dt
-        except:
-            return datetime.min
-    
     audio_files.sort(key=extract_timestamp)
     log_msg(f"Found {len(audio_files)} audio files to merge")
     
@@ -75,13 +197,14 @@ def merge_audio_chunks_direct(chunks_dir, out_path, log_file=None):
     merged_audio = None
     successful_merges = 0
     
-    for i, fname in enumerate(audio_files):
-        fpath = os.path.join(chunks_dir, fname)
+    # Chunks are decoded in parallel (see iter_decoded_chunks) and come back in timestamp order
+    decoded = iter_decoded_chunks([os.path.join(chunks_dir, f) for f in audio_files])
+    for i, (fpath, audio, error) in enumerate(decoded):
+        fname = os.path.basename(fpath)
         try:
             log_msg(f"Processing {i+1}/{len(audio_files)}: {fname}")
-            
-            # Load audio with pydub (supports multiple formats)
-            audio = AudioSegment.from_file(fpath)
+            if error is not None:
+                raise error
             
             if merged_audio is None:
                 merged_audio = audio
@@ -114,7 +237,7 @@ def merge_audio_chunks_direct(chunks_dir, out_path, log_file=None):
         # Create output directory if needed
         os.makedirs(os.path.dirname(out_path) if os.path.dirname(out_path) else ".", exist_ok=True)
         merged_audio.export(out_path, format="ogg", bitrate="128k", codec="libvorbis", parameters=["-q:a", "7"])
-        log_msg(f"OGG export completed successfully!")
+        log_msg("OGG export completed successfully!")
         log_msg(f"Output file size: {os.path.getsize(out_path) / (1024*1024):.2f} MB")
         return out_path
         
@@ -125,7 +248,402 @@ def merge_audio_chunks_direct(chunks_dir, out_path, log_file=None):
         raise RuntimeError(f"Failed to export OGG: {str(e)}")
 
 
+# Incremental merge state, kept next to the chunks dir of each meeting
+MERGE_PCM_FILE = "merged.pcm"
+MERGE_STATE_FILE = "merge_state.json"
+MERGE_SAMPLE_WIDTH = 2  # the persistent stream is always s16le
+
+def _load_merge_state(state_path, pcm_path):
+    """
+    Load the incremental merge state and make sure the PCM stream matches it.
+    Returns None when the stream has to be rebuilt from scratch.
+    """
+    if not os.path.exists(state_path) or not os.path.exists(pcm_path):
+        return None
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        pcm_size = os.path.getsize(pcm_path)
+        if pcm_size < state["pcm_bytes"]:
+            return None
+        if pcm_size > state["pcm_bytes"]:
+            # An append was interrupted before the state was saved
+            with open(pcm_path, "r+b") as f:
+                f.truncate(state["pcm_bytes"])
+        return state
+    except Exception:
+        return None
+
+def write_json_atomic(path, data):
+    """Write JSON to path via a temp file + rename, so readers never see half a file"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+@contextmanager
+def file_lock(lock_path):
+    """Exclusive advisory lock shared by gunicorn workers and the STT service"""
+    import fcntl
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def ogg_encoder_cmd(pcm_input, out_path, frame_rate, channels):
+    """ffmpeg command that encodes raw s16le PCM (a file or "pipe:0") to OGG/Vorbis"""
+    return [
+        AudioSegment.converter, "-y", "-loglevel", "error",
+        "-f", "s16le", "-ar", str(frame_rate), "-ac", str(channels), "-i", pcm_input,
+        "-c:a", "libvorbis", "-q:a", "7", "-f", "ogg", out_path,
+    ]
+
+def encode_pcm_to_ogg(pcm_path, out_path, frame_rate, channels):
+    """
+    Encode a raw s16le PCM file to OGG/Vorbis with ffmpeg.
+    ffmpeg streams the input, so memory does not grow with its length.
+    """
+    import subprocess
+    cmd = ogg_encoder_cmd(pcm_path, out_path, frame_rate, channels)
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {proc.stderr.decode('utf-8', 'replace').strip()}")
+    return out_path
+
+def merge_audio_chunks_incremental(chunks_dir, out_path, log_file=None, work_dir=None):
+    """
+    Merge audio chunks to OGG, decoding only chunks that are new since the
+    last merge.
+
+    Decoded audio is appended to a persistent raw PCM stream (merged.pcm in
+    work_dir, by default the meeting directory) and the chunks already in it
+    are recorded in merge_state.json. Each merge decodes just the new chunks
+    (in parallel, appended in order), then ffmpeg streams the PCM file into the
+    OGG encoder, so memory stays flat however long the meeting is. If a new chunk sorts before
+    one already merged, the stream is rebuilt to keep timestamp order.
+
+    The size and mtime of each chunk are recorded too: a merged chunk that
+    changed since (e.g. it was still being written) forces a rebuild, and
+    chunks that failed to decode are retried on the next merge.
+    """
+    log_msg = make_log_msg(log_file)
+
+    if not os.path.exists(chunks_dir):
+        raise RuntimeError("Audio chunks directory does not exist")
+
+    audio_files = [f for f in os.listdir(chunks_dir) if f.lower().endswith(AUDIO_EXTENSIONS)]
+    if not audio_files:
+        raise RuntimeError("No audio chunks to merge")
+    audio_files.sort(key=lambda f: (extract_timestamp(f), f))
+
+    work_dir = work_dir or os.path.dirname(os.path.abspath(chunks_dir))
+    pcm_path = os.path.join(work_dir, MERGE_PCM_FILE)
+    state_path = os.path.join(work_dir, MERGE_STATE_FILE)
+
+    # (size, mtime) of every chunk, taken before decoding: a chunk that is still
+    # being written or is replaced later shows up as changed on the next merge
+    stats = {}
+    for f in audio_files:
+        try:
+            st = os.stat(os.path.join(chunks_dir, f))
+            stats[f] = [st.st_size, st.st_mtime_ns]
+        except OSError:
+            pass
+    audio_files = [f for f in audio_files if f in stats]
+
+    state = _load_merge_state(state_path, pcm_path)
+    if state is not None and "files" not in state:
+        state = None
+    if state is not None:
+        changed = [f for f in state["merged"] if stats.get(f) != state["files"].get(f)]
+        if changed:
+            log_msg(f"Merged chunk {changed[0]} changed or was removed, rebuilding stream")
+            state = None
+
+    if state is not None:
+        # Failed chunks are retried on every merge
+        merged = set(state["merged"])
+        new_files = [f for f in audio_files if f not in merged]
+        last = state["merged"][-1] if state["merged"] else None
+        key = lambda f: (extract_timestamp(f), f)
+        for f in [f for f in new_files if last and key(f) < key(last)]:
+            if f in state["failed"] and stats[f] == state["files"].get(f):
+                # Unchanged chunk that failed before: only worth a rebuild if it decodes now
+                try:
+                    load_chunk_audio(os.path.join(chunks_dir, f))
+                except Exception as e:
+                    log_msg(f"Chunk {f} still fails to decode: {str(e)}")
+                    new_files.remove(f)
+                    continue
+            log_msg(f"Chunk {f} is older than merged chunk {last}, rebuilding stream")
+            state = None
+            break
+
+    if state is None:
+        state = {"frame_rate": None, "channels": None, "pcm_bytes": 0, "merged": [], "failed": [], "files": {}}
+        new_files = audio_files
+        with open(pcm_path, "wb"):
+            pass
+    else:
+        state["failed"] = [f for f in state["failed"] if f not in new_files and f in stats]
+
+    log_msg(f"Found {len(audio_files)} audio files, {len(new_files)} new since last merge")
+
+    with open(pcm_path, "ab") as pcm:
+        target = (state["frame_rate"], state["channels"]) if state["frame_rate"] else None
+        decoded = iter_decoded_chunks([os.path.join(chunks_dir, f) for f in new_files], target)
+        for i, (fpath, audio, error) in enumerate(decoded):
+            fname = os.path.basename(fpath)
+            try:
+                log_msg(f"Processing {i+1}/{len(new_files)}: {fname}")
+                if error is not None:
+                    raise error
+
+                if state["frame_rate"] is None:
+                    state["frame_rate"] = audio.frame_rate
+                    state["channels"] = audio.channels
+                    log_msg(f"  -> Stream format: {audio.channels}ch, {audio.frame_rate}Hz")
+
+                # Make sure same format before appending
+                if audio.frame_rate != state["frame_rate"]:
+                    audio = audio.set_frame_rate(state["frame_rate"])
+                if audio.channels != state["channels"]:
+                    audio = audio.set_channels(state["channels"])
+                if audio.sample_width != MERGE_SAMPLE_WIDTH:
+                    audio = audio.set_sample_width(MERGE_SAMPLE_WIDTH)
+
+                pcm.write(audio.raw_data)
+                pcm.flush()
+                state["pcm_bytes"] += len(audio.raw_data)
+                state["merged"].append(fname)
+                state["files"][fname] = stats[fname]
+                log_msg(f"  -> Added {audio.duration_seconds:.2f}s")
+
+            except Exception as e:
+                log_msg(f"  -> WARNING: Failed to process {fname}: {str(e)}")
+                state["failed"].append(fname)
+                state["files"][fname] = stats[fname]
+            finally:
+                write_json_atomic(state_path, state)
+
+    if not state["merged"]:
+        raise RuntimeError("Failed to merge any audio files")
+
+    bytes_per_second = state["frame_rate"] * state["channels"] * MERGE_SAMPLE_WIDTH
+    log_msg(f"\nStream contains {len(state['merged'])}/{len(audio_files)} files")
+    log_msg(f"Total duration: {state['pcm_bytes'] / bytes_per_second:.2f} seconds")
+
+    try:
+        log_msg(f"\nExporting to OGG format: {out_path}")
+        os.makedirs(os.path.dirname(out_path) if os.path.dirname(out_path) else ".", exist_ok=True)
+        encode_pcm_to_ogg(pcm_path, out_path, state["frame_rate"], state["channels"])
+        log_msg("OGG export completed successfully!")
+        log_msg(f"Output file size: {os.path.getsize(out_path) / (1024*1024):.2f} MB")
+        return out_path
+
+    except Exception as e:
+        log_msg(f"ERROR during OGG export: {str(e)}")
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        raise RuntimeError(f"Failed to export OGG: {str(e)}")
+
+
+def merge_audio_chunks_streaming(chunks_dir, out_path, log_file=None):
+    """
+    Merge audio chunks to OGG with bounded memory.
+
+    Chunks are decoded on the merge process pool, converted to the sample rate
+    and channel count of the first chunk (as in merge_audio_chunks_direct),
+    and their PCM frames are written in extract_timestamp order straight into
+    a single ffmpeg/libvorbis encoder over a pipe. Peak memory is a few
+    decoded chunks (the pool's look-ahead window), whatever the meeting length.
+    """
+    import subprocess
+    log_msg = make_log_msg(log_file)
+
+    if not os.path.exists(chunks_dir):
+        raise RuntimeError("Audio chunks directory does not exist")
+
+    audio_files = [f for f in os.listdir(chunks_dir) if f.lower().endswith(AUDIO_EXTENSIONS)]
+    if not audio_files:
+        raise RuntimeError("No audio chunks to merge")
+
+    audio_files.sort(key=extract_timestamp)
+    log_msg(f"Found {len(audio_files)} audio files to merge")
+    os.makedirs(os.path.dirname(out_path) if os.path.dirname(out_path) else ".", exist_ok=True)
+
+    encoder = None
+    frame_rate = channels = None
+    successful_merges = 0
+    total_bytes = 0
+
+    try:
+        decoded = iter_decoded_chunks([os.path.join(chunks_dir, f) for f in audio_files])
+        for i, (fpath, audio, error) in enumerate(decoded):
+            fname = os.path.basename(fpath)
+            try:
+                log_msg(f"Processing {i+1}/{len(audio_files)}: {fname}")
+                if error is not None:
+                    raise error
+            except Exception as e:
+                log_msg(f"  -> WARNING: Failed to process {fname}: {str(e)}")
+                continue
+
+            if encoder is None:
+                frame_rate, channels = audio.frame_rate, audio.channels
+                log_msg(f"  -> Encoder format: {channels}ch, {frame_rate}Hz")
+                encoder = subprocess.Popen(
+                    ogg_encoder_cmd("pipe:0", out_path, frame_rate, channels),
+                    stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                )
+
+            # Make sure same format before streaming
+            if audio.frame_rate != frame_rate:
+                audio = audio.set_frame_rate(frame_rate)
+            if audio.channels != channels:
+                audio = audio.set_channels(channels)
+            if audio.sample_width != MERGE_SAMPLE_WIDTH:
+                audio = audio.set_sample_width(MERGE_SAMPLE_WIDTH)
+
+            encoder.stdin.write(audio.raw_data)
+            total_bytes += len(audio.raw_data)
+            successful_merges += 1
+            log_msg(f"  -> Streamed {audio.duration_seconds:.2f}s")
+            del audio
+
+        if encoder is None:
+            raise RuntimeError("Failed to merge any audio files")
+
+        encoder.stdin.close()
+        stderr = encoder.stderr.read()
+        if encoder.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed: {stderr.decode('utf-8', 'replace').strip()}")
+
+    except Exception as e:
+        if encoder is not None and encoder.poll() is None:
+            encoder.kill()
+            encoder.wait()
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        if isinstance(e, BrokenPipeError):
+            stderr = encoder.stderr.read().decode("utf-8", "replace").strip()
+            e = RuntimeError(f"ffmpeg failed: {stderr}")
+        log_msg(f"ERROR during OGG export: {str(e)}")
+        raise RuntimeError(f"Failed to export OGG: {str(e)}")
+
+    bytes_per_second = frame_rate * channels * MERGE_SAMPLE_WIDTH
+    log_msg(f"\nSuccessfully merged {successful_merges}/{len(audio_files)} files")
+    log_msg(f"Total duration: {total_bytes / bytes_per_second:.2f} seconds")
+    log_msg("OGG export completed successfully!")
+    log_msg(f"Output file size: {os.path.getsize(out_path) / (1024*1024):.2f} MB")
+    return out_path
+
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+def read_wav_layout(path):
+    """
+    Parse the RIFF header of a PCM WAV without reading its samples.
+    Returns ((channels, sample_width, frame_rate), data_offset, data_size),
+    with data_size cut to whole frames actually present in the file.
+    Recorders that stream WAVs often leave the size fields at 0 or 0xFFFFFFFF:
+    a data size of 0 or one past the end of the file means "runs to EOF".
+    """
+    import struct
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            raise ValueError("not a RIFF/WAVE file")
+        params = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError("no data chunk")
+            chunk_id, chunk_size = header[:4], struct.unpack("<I", header[4:])[0]
+            if chunk_id == b"fmt ":
+                fmt = f.read(chunk_size)
+                if len(fmt) < 16:
+                    raise ValueError("truncated fmt chunk")
+                format_tag, channels, frame_rate, _, block_align, bits = struct.unpack("<HHIIHH", fmt[:16])
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                    format_tag = struct.unpack("<H", fmt[24:26])[0]  # first two bytes of the SubFormat GUID
+                if format_tag != WAVE_FORMAT_PCM or not channels or not block_align:
+                    raise ValueError(f"unsupported WAV format {format_tag:#x}")
+                params = (channels, (bits + 7) // 8, frame_rate)
+                f.seek(chunk_size & 1, 1)
+            elif chunk_id == b"data":
+                if params is None:
+                    raise ValueError("data chunk before fmt chunk")
+                data_offset = f.tell()
+                data_size = file_size - data_offset
+                if 0 < chunk_size < data_size:
+                    data_size = chunk_size
+                return params, data_offset, data_size - data_size % block_align
+            else:
+                f.seek(chunk_size + (chunk_size & 1), 1)
+
+def wav_header(channels, sample_width, frame_rate, data_size):
+    """44-byte canonical PCM WAV header (the layout wave.open(..., "wb") writes)"""
+    import struct
+    block_align = channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE", b"fmt ", 16, WAVE_FORMAT_PCM, channels, frame_rate,
+        frame_rate * block_align, block_align, sample_width * 8, b"data", data_size,
+    )
+
+def copy_file_range_to(src, dst, offset, count):
+    """
+    Append count bytes starting at offset of file src to the current position of
+    dst without Python-level buffers: copy_file_range (in-kernel, reflinks on
+    filesystems that support it), else sendfile, else a write of an mmap view.
+    Returns the number of bytes copied (less than count if src is shorter).
+    """
+    import errno
+    import mmap
+    copied = 0
+    use_copy_file_range = hasattr(os, "copy_file_range")
+    use_sendfile = hasattr(os, "sendfile")
+    while copied < count:
+        try:
+            if use_copy_file_range:
+                n = os.copy_file_range(src.fileno(), dst.fileno(), count - copied, offset + copied)
+            elif use_sendfile:
+                n = os.sendfile(dst.fileno(), src.fileno(), offset + copied, count - copied)
+            else:
+                with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    end = min(offset + count, len(mm))
+                    with memoryview(mm)[offset + copied:end] as view:
+                        n = dst.write(view)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP):
+                raise
+            # Not supported between these files/filesystems: try the next method
+            if use_copy_file_range:
+                use_copy_file_range = False
+            elif use_sendfile:
+                use_sendfile = False
+            else:
+                raise
+            continue
+        if n == 0:
+            break
+        copied += n
+    return copied
+
 def merge_audio_chunks(chunks_dir, out_path):
+    """
+    Concatenate WAV chunks into one WAV.
+
+    Headers are checked in one pass (the first valid file sets the format,
+    files with other parameters are skipped), then each data section is copied
+    straight into the output by the kernel (see copy_file_range_to) and the
+    RIFF sizes are patched at the end. No samples pass through Python.
+    """
     if not os.path.exists(chunks_dir):
         raise RuntimeError("Audio chunks directory does not exist")
     
@@ -133,69 +651,62 @@ def merge_audio_chunks(chunks_dir, out_path):
     if not files:
         raise RuntimeError("No audio chunks to merge")
     
-    def extract_timestamp(filename):
-        try:
-            date_part = filename.split("__")[0]  # Lấy phần timestamp
-            dt = datetime.strptime(date_part, "%d-%m-%Y_%H-%M-%S")
-            return dt
-        except:
-            return datetime.min  # File không đúng format sẽ đẩy lên đầu
-    
     files.sort(key=extract_timestamp)
     
-    n_channels = None
-    sampwidth = None
-    framerate = None
-    valid_files = []
+    params = None
+    sections = []
     
     print(f"Checking {len(files)} files...")
     
     for fname in files:
         fpath = os.path.join(chunks_dir, fname)
         try:
-            with wave.open(fpath, 'rb') as wav_file:
-                if n_channels is None:
-                    params = wav_file.getparams()
-                    n_channels = params.nchannels
-                    sampwidth = params.sampwidth
-                    framerate = params.framerate
-                    print(f"Using audio params from {fname}: {n_channels}ch, {sampwidth}bytes, {framerate}Hz")
-                valid_files.append(fname)
+            file_params, data_offset, data_size = read_wav_layout(fpath)
         except Exception as e:
             print(f"WARNING: Skipping corrupted file {fname}: {str(e)}")
             continue
+        if params is None:
+            params = file_params
+            print(f"Using audio params from {fname}: {params[0]}ch, {params[1]}bytes, {params[2]}Hz")
+        elif file_params != params:
+            print(f"WARNING: {fname} has different audio parameters, skipping...")
+            continue
+        sections.append((fname, data_offset, data_size))
     
-    if not valid_files:
+    if not sections:
         raise RuntimeError("No valid WAV files found to merge")
     
-    print(f"Found {len(valid_files)} valid files out of {len(files)}")
+    print(f"Found {len(sections)} valid files out of {len(files)}")
     
     try:
-        with wave.open(out_path, 'wb') as output:
-            output.setnchannels(n_channels)
-            output.setsampwidth(sampwidth)
-            output.setframerate(framerate)
+        with open(out_path, "wb", buffering=0) as output:
+            output.write(wav_header(*params, 0))
             
             merged_count = 0
-            for i, fname in enumerate(valid_files):
-                fpath = os.path.join(chunks_dir, fname)
-                print(f"Merging {i+1}/{len(valid_files)}: {fname}")
-                
+            total = 0
+            for i, (fname, data_offset, data_size) in enumerate(sections):
+                print(f"Merging {i+1}/{len(sections)}: {fname}")
                 try:
-                    with wave.open(fpath, 'rb') as wav_file:
-                        if (wav_file.getnchannels() != n_channels or
-                            wav_file.getsampwidth() != sampwidth or
-                            wav_file.getframerate() != framerate):
-                            print(f"WARNING: {fname} has different audio parameters, skipping...")
-                            continue
-                        
-                        frames = wav_file.readframes(wav_file.getnframes())
-                        output.writeframes(frames)
-                        merged_count += 1
-                        
+                    with open(os.path.join(chunks_dir, fname), "rb") as src:
+                        copied = copy_file_range_to(src, output, data_offset, data_size)
                 except Exception as e:
                     print(f"ERROR reading {fname}: {str(e)}, skipping...")
+                    output.truncate(len(wav_header(*params, 0)) + total)
+                    output.seek(0, os.SEEK_END)
                     continue
+                block_align = params[0] * params[1]
+                if copied % block_align:
+                    # The file shrank under us: drop the partial frame
+                    output.truncate(output.tell() - copied % block_align)
+                    output.seek(0, os.SEEK_END)
+                    copied -= copied % block_align
+                total += copied
+                merged_count += 1
+            
+            if 36 + total > 0xFFFFFFFF:
+                raise RuntimeError("merged audio exceeds the 4 GB WAV limit")
+            output.seek(0)
+            output.write(wav_header(*params, total))
         
         print(f"Successfully merged {merged_count}/{len(files)} files to {out_path}")
         return out_path
@@ -206,58 +717,186 @@ def merge_audio_chunks(chunks_dir, out_path):
         raise RuntimeError(f"Error creating merged file: {str(e)}")
 
 
-def transcribe_with_whisper(filepath):
+def transcribe_with_whisper(filepath, tier=None):
     """
-    Transcribe audio file using Whisper model with caching
+    Transcribe audio file using the cached model of a quality tier
     """
-    try:
-        import whisper
-    except Exception as e:
-        raise RuntimeError("whisper package not installed: " + str(e))
-    
-    model = get_whisper_model("base")
-    result = model.transcribe(filepath)
-    return result.get("text", "").strip()
+    from stt_backends import model_for_tier
+    backend = get_whisper_model(model_for_tier(tier))
+    return backend.transcribe(filepath).strip()
+
+# Consecutive entries of the same user within this many seconds are coalesced
+TRANSCRIPT_MERGE_WINDOW = 30
+
+# Server-side append with coalescing, so the read-modify-write of the last
+# entry is atomic and a whole batch costs a single round-trip.
+# KEYS[1] = transcript list, ARGV[1] = merge window (s), ARGV[2..] = JSON entries
+APPEND_TRANSCRIPT_LUA = """
+local function epoch(ts)
+    if type(ts) ~= "string" then return nil end
+    local d, m, y, H, M, S = string.match(ts, "^(%d+)-(%d+)-(%d+)_(%d+)-(%d+)-(%d+)$")
+    if not d then return nil end
+    y, m, d = tonumber(y), tonumber(m), tonumber(d)
+    if m <= 2 then y = y - 1 end
+    local era = math.floor(y / 400)
+    local yoe = y - era * 400
+    local doy = math.floor((153 * ((m + 9) % 12) + 2) / 5) + d - 1
+    local doe = yoe * 365 + math.floor(yoe / 4) - math.floor(yoe / 100) + doy
+    return (era * 146097 + doe - 719468) * 86400 + tonumber(H) * 3600 + tonumber(M) * 60 + tonumber(S)
+end
+
+local window = tonumber(ARGV[1])
+local last_raw = redis.call("LINDEX", KEYS[1], -1)
+local last = nil
+if last_raw then last = cjson.decode(last_raw) end
+
+for i = 2, #ARGV do
+    local entry = cjson.decode(ARGV[i])
+    local merged = false
+    if last then
+        local tlast, tcur = epoch(last["ts"]), epoch(entry["ts"])
+        local gap = 9999
+        if tlast and tcur then gap = tcur - tlast end
+        if last["user_id"] == entry["user_id"] and gap <= window then
+            last["text"] = (last["text"] or "") .. " " .. (entry["text"] or "")
+            redis.call("LSET", KEYS[1], -1, cjson.encode(last))
+            merged = true
+        end
+    end
+    if not merged then
+        redis.call("RPUSH", KEYS[1], ARGV[i])
+        last = entry
+    end
+end
+return redis.call("LLEN", KEYS[1])
+"""
+_append_transcript_script = r.register_script(APPEND_TRANSCRIPT_LUA)
 
 def append_transcript_cache(meeting_id, entry):
-    cache_key = f"meeting:{meeting_id}:transcripts"
-    last = r.lindex(cache_key, -1)
-    if last:
-        last_e = json.loads(last)
-        try:
-            fmt_ddmmyyyy = "%d-%m-%Y_%H-%M-%S"
-            tlast = datetime.strptime(last_e["ts"], fmt_ddmmyyyy)
-            tcur = datetime.strptime(entry["ts"], fmt_ddmmyyyy)
-            gap = (tcur - tlast).total_seconds()
-        except Exception:
-            gap = 9999
-        if last_e.get("user_id") == entry.get("user_id") and gap <= 30:
-            last_e["text"] = last_e.get("text", "") + " " + entry.get("text", "")
-            r.rpop(cache_key)
-            r.rpush(cache_key, json.dumps(last_e))
-            return
-    r.rpush(cache_key, json.dumps(entry))
+    """
+    Append one entry to the meeting's transcript cache, merging it into the
+    previous entry when it is the same user within TRANSCRIPT_MERGE_WINDOW seconds.
+    """
+    append_transcript_cache_bulk({meeting_id: [entry]})
+
+class TranscriptCacheError(RuntimeError):
+    """Appending to the transcript cache failed for some meetings ({meeting_id: error})"""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(f"meeting {m}: {e}" for m, e in errors.items()))
+        self.errors = errors
+
+def append_transcript_cache_bulk(entries_by_meeting):
+    """
+    Append batches of entries ({meeting_id: [entry, ...]}) with the same merge
+    rules as append_transcript_cache, in one pipelined round-trip.
+    Raises TranscriptCacheError naming the meetings whose append failed
+    (the others are stored), or the Redis error if the round-trip itself failed.
+    """
+    pipe = r.pipeline(transaction=False)
+    meeting_ids = []
+    for meeting_id, entries in entries_by_meeting.items():
+        if not entries:
+            continue
+        cache_key = f"meeting:{meeting_id}:transcripts"
+        args = [TRANSCRIPT_MERGE_WINDOW] + [json.dumps(e) for e in entries]
+        _append_transcript_script(keys=[cache_key], args=args, client=pipe)
+        meeting_ids.append(meeting_id)
+    results = pipe.execute(raise_on_error=False)
+    errors = {m: res for m, res in zip(meeting_ids, results) if isinstance(res, Exception)}
+    if errors:
+        raise TranscriptCacheError(errors)
+
+# Content-addressed artifact cache. Generated files in a meeting's final dir
+# are recorded in final/.artifacts.json under a logical name together with a
+# hash of their inputs; a request with the same inputs reuses the file.
+# Bump TRANSCRIPT_TEMPLATE_VERSION whenever the DOCX layout changes.
+TRANSCRIPT_TEMPLATE_VERSION = "1"
+ARTIFACT_MANIFEST_FILE = ".artifacts.json"
+
+def artifact_key(*parts):
+    """sha256 over the given inputs (str, bytes or JSON-serializable values)"""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            data = part
+        elif isinstance(part, str):
+            data = part.encode("utf-8")
+        else:
+            data = json.dumps(part, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.hexdigest()
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def transcript_docx_key(meeting_id, entries):
+    return artifact_key("docx", TRANSCRIPT_TEMPLATE_VERSION, meeting_id, entries)
+
+def pdf_artifact_key(docx_path):
+    return artifact_key("pdf", TRANSCRIPT_TEMPLATE_VERSION, file_digest(docx_path))
+
+def _read_artifact_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, ARTIFACT_MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def get_cached_artifact(output_dir, name, key):
+    """Path of the artifact stored under name if it was built from the same inputs"""
+    record = _read_artifact_manifest(output_dir).get(name)
+    if not record or record.get("key") != key:
+        return None
+    path = os.path.join(output_dir, record["file"])
+    return path if os.path.exists(path) else None
+
+def store_artifact(output_dir, name, key, path):
+    """Record path as the artifact for name, built from inputs hashed to key"""
+    with file_lock(os.path.join(output_dir, ".artifacts.lock")):
+        manifest = _read_artifact_manifest(output_dir)
+        manifest[name] = {"key": key, "file": os.path.basename(path), "created": datetime.utcnow().isoformat()}
+        write_json_atomic(os.path.join(output_dir, ARTIFACT_MANIFEST_FILE), manifest)
 
 def build_docx_and_pdf(meeting_id, entries, output_dir):
-    doc = Document()
-    doc.add_heading(f"Bien ban cuoc hop: {meeting_id}", level=1)
-    doc.add_paragraph(f"Created: {datetime.utcnow().strftime('%d/%m/%Y %H:%M:%S UTC')}")
-    doc.add_paragraph("")
-    for e in entries:
-        ts_str = e.get("ts", "")
-        line = f"({ts_str}) {e.get('full_name','Unknown')} - {e.get('role','')}: {e.get('text','')}"
-        doc.add_paragraph(line)
     docx_path = os.path.join(output_dir, f"{meeting_id}.docx")
-    doc.save(docx_path)
+    docx_key = transcript_docx_key(meeting_id, entries)
+    if get_cached_artifact(output_dir, "docx", docx_key) is None:
+        doc = Document()
+        doc.add_heading(f"Bien ban cuoc hop: {meeting_id}", level=1)
+        doc.add_paragraph(f"Created: {datetime.utcnow().strftime('%d/%m/%Y %H:%M:%S UTC')}")
+        doc.add_paragraph("")
+        for e in entries:
+            ts_str = e.get("ts", "")
+            line = f"({ts_str}) {e.get('full_name','Unknown')} - {e.get('role','')}: {e.get('text','')}"
+            doc.add_paragraph(line)
+        with stage_timer("docx_write"):
+            doc.save(docx_path)
+        store_artifact(output_dir, "docx", docx_key, docx_path)
+
     pdf_path = os.path.join(output_dir, f"{meeting_id}.pdf")
-    try_convert_docx_to_pdf_libreoffice(docx_path, pdf_path)
+    pdf_key = pdf_artifact_key(docx_path)
+    if get_cached_artifact(output_dir, "pdf", pdf_key) is None:
+        with stage_timer("pdf_convert"):
+            converted = try_convert_docx_to_pdf_libreoffice(docx_path, pdf_path)
+        if converted:
+            store_artifact(output_dir, "pdf", pdf_key, pdf_path)
     return docx_path, pdf_path
 
 def try_convert_docx_to_pdf_libreoffice(docx_path, pdf_path):
     try:
         outdir = os.path.dirname(pdf_path)
         import subprocess
-        cmd = ["soffice", "--headless", "--convert-to", "pdf", "--outdir", outdir, docx_path]
+        # Private profile per process/thread: concurrent soffice runs must not share one
+        import tempfile, threading
+        profile_dir = os.path.join(tempfile.gettempdir(), f"lo_profile_{os.getpid()}_{threading.get_ident()}")
+        cmd = ["soffice", "--headless", f"-env:UserInstallation=file://{profile_dir}",
+               "--convert-to", "pdf", "--outdir", outdir, docx_path]
         subprocess.check_call(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         produced = os.path.join(outdir, os.path.splitext(os.path.basename(docx_path))[0] + ".pdf")
         if os.path.exists(produced):
@@ -284,24 +923,67 @@ def clear_transcript_cache(meeting_id):
     except Exception as e:
         print(f"❌ Failed to clear transcript cache for meeting_id={meeting_id}: {str(e)}")
 
-def wait_for_stt_jobs(meeting_id):
+# Outstanding STT jobs per meeting: INCR on enqueue, DECR when a job finishes.
+# The worker that brings the counter to zero publishes on the done channel.
+STT_WAIT_TIMEOUT = float(os.getenv("STT_WAIT_TIMEOUT", "900"))
+
+def stt_pending_key(meeting_id):
+    return f"meeting:{meeting_id}:stt_pending"
+
+def stt_done_channel(meeting_id):
+    return f"meeting:{meeting_id}:stt_done"
+
+def mark_stt_finished(meeting_id, processing_key=None, raw=None):
+    """
+    Decrement the meeting's outstanding STT counter and notify waiters
+    when the last job is done. Returns the remaining count.
+    With processing_key, the job (raw) is dropped from that processing list
+    in the same MULTI, so a crash cannot remove the job without counting it.
+    """
+    pipe = r.pipeline()
+    if processing_key is not None:
+        pipe.lrem(processing_key, 1, raw)
+    pipe.decr(stt_pending_key(meeting_id))
+    remaining = pipe.execute()[-1]
+    if remaining <= 0:
+        if remaining < 0:
+            # A job was processed twice (re-queued after a crash)
+            r.set(stt_pending_key(meeting_id), 0)
+        r.publish(stt_done_channel(meeting_id), "done")
+        return 0
+    return remaining
+
+def wait_for_stt_jobs(meeting_id, timeout=None):
     """
     Wait for all STT jobs related to a specific meeting_id to complete.
+    Blocks on a pub/sub notification instead of polling; returns True when
+    the meeting has no outstanding jobs, False on timeout.
     """
-    cache_key = f"meeting:{meeting_id}:transcripts"
-    while True:
-        try:
-            # Check if there are any pending STT jobs for the meeting_id
-            pending_jobs = r.lrange(cache_key, 0, -1)
-            if pending_jobs:
-                print(f"Waiting for {len(pending_jobs)} STT jobs to complete for meeting_id={meeting_id}...")
-                time.sleep(2)  # Wait before checking again
-            else:
+    timeout = STT_WAIT_TIMEOUT if timeout is None else timeout
+    pubsub = r.pubsub(ignore_subscribe_messages=True)
+    try:
+        # Subscribe before reading the counter so the final notification cannot be missed
+        pubsub.subscribe(stt_done_channel(meeting_id))
+        deadline = time.monotonic() + timeout
+        last_pending = None
+        while True:
+            pending = int(r.get(stt_pending_key(meeting_id)) or 0)
+            if pending <= 0:
                 print(f"All STT jobs completed for meeting_id={meeting_id}.")
-                break
-        except Exception as e:
-            print(f"Error while waiting for STT jobs: {str(e)}")
-            break
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"Timed out waiting for {pending} STT jobs for meeting_id={meeting_id}")
+                return False
+            if pending != last_pending:
+                print(f"Waiting for {pending} STT jobs to complete for meeting_id={meeting_id}...")
+                last_pending = pending
+            pubsub.get_message(timeout=remaining)
+    except Exception as e:
+        print(f"Error while waiting for STT jobs: {str(e)}")
+        return False
+    finally:
+        pubsub.close()
 
 def delete_old_transcripts(final_dir):
     """
@@ -352,4 +1034,143 @@ def append_to_docx(meeting_id, entry):
 
     # Save the updated DOCX
     doc.save(docx_path)
-    print(f"Updated DOCX file: {docx_path}")
\ No newline at end of file
+    print(f"Updated DOCX file: {docx_path}")
+
+
+# Append-only transcript store: one JSON line per transcribed segment in
+# meetings/<id>/transcript.jsonl. The DOCX is only built on demand.
+TRANSCRIPT_LOG_FILE = "transcript.jsonl"
+TRANSCRIPT_STATE_FILE = "transcript_state.json"
+
+def transcript_docx_path(meeting_id):
+    return os.path.join(MEETINGS_DIR, meeting_id, "final", f"transcript_{meeting_id}.docx")
+
+def append_transcript_segment(meeting_id, entry):
+    """
+    Append a transcript entry to the meeting's segment log.
+    A single O_APPEND write per entry, so the cost does not grow with meeting length.
+    """
+    meeting_dir = os.path.join(MEETINGS_DIR, meeting_id)
+    os.makedirs(meeting_dir, exist_ok=True)
+    line = json.dumps(entry, ensure_ascii=False) + "\n"
+    with open(os.path.join(meeting_dir, TRANSCRIPT_LOG_FILE), "a", encoding="utf-8") as f:
+        f.write(line)
+
+def read_transcript_segments(meeting_id, offset=0):
+    """
+    Read segments from the log starting at byte offset.
+    Returns (entries, end_offset); a trailing partial line is left for the next read.
+    """
+    log_path = os.path.join(MEETINGS_DIR, meeting_id, TRANSCRIPT_LOG_FILE)
+    if not os.path.exists(log_path):
+        return [], offset
+    entries = []
+    with open(log_path, "rb") as f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            offset += len(raw)
+            entries.append(json.loads(raw))
+    return entries, offset
+
+def ensure_transcript_docx(meeting_id):
+    """
+    Bring transcript_<id>.docx up to date with the segment log.
+
+    The DOCX is a cache: if no segments arrived since the last build it is
+    returned as is. Otherwise only the new segments are appended, in one
+    open/save, so edits made through push_document are kept.
+    Once the document is edited through the paragraph store (document_store.py),
+    the store owns the transcript and the DOCX is rendered from it instead.
+    Returns the DOCX path, or None if there is nothing to build.
+    """
+    meeting_dir = os.path.join(MEETINGS_DIR, meeting_id)
+    if not os.path.isdir(meeting_dir):
+        return None
+    import document_store
+    if document_store.has_document(meeting_id):
+        return document_store.render_docx(meeting_id)
+    docx_path = transcript_docx_path(meeting_id)
+    state_path = os.path.join(meeting_dir, TRANSCRIPT_STATE_FILE)
+
+    with file_lock(os.path.join(meeting_dir, ".transcript.lock")):
+        state = {"offset": 0, "segments": 0}
+        if os.path.exists(state_path) and os.path.exists(docx_path):
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+
+        entries, offset = read_transcript_segments(meeting_id, state["offset"])
+        if not entries:
+            return docx_path if os.path.exists(docx_path) else None
+
+        # Load existing DOCX or create a new one
+        os.makedirs(os.path.dirname(docx_path), exist_ok=True)
+        if os.path.exists(docx_path):
+            doc = Document(docx_path)
+        else:
+            doc = Document()
+            doc.add_heading(f"Bien ban cuoc hop: {meeting_id}", level=1)
+            doc.add_paragraph(f"Created: {datetime.utcnow().strftime('%d/%m/%Y %H:%M:%S UTC')}")
+            doc.add_paragraph("")
+
+        for e in entries:
+            line = f"({e.get('ts', '')}) {e.get('full_name', 'Unknown')} - {e.get('role', '')}: {e.get('text', '')}"
+            doc.add_paragraph(line)
+
+        with stage_timer("docx_write"):
+            doc.save(docx_path)
+        write_json_atomic(state_path, {"offset": offset, "segments": state["segments"] + len(entries)})
+        print(f"Updated DOCX file: {docx_path} (+{len(entries)} segments)")
+        return docx_path
+
+# Live transcript feed: every stored segment is also added (XADD) to a Redis
+# stream per meeting. Stream IDs are the sequence numbers that SSE clients of
+# /api/transcript_stream resume from (Last-Event-ID).
+TRANSCRIPT_STREAM_MAXLEN = int(os.getenv("TRANSCRIPT_STREAM_MAXLEN", "10000"))
+TRANSCRIPT_STREAM_TTL = int(os.getenv("TRANSCRIPT_STREAM_TTL", str(7 * 24 * 3600)))
+
+def transcript_stream_key(meeting_id):
+    return f"meeting:{meeting_id}:segments"
+
+def segment_event(entry):
+    """Public form of a transcript entry (no server paths)"""
+    source_file = entry.get("source_file")
+    return {
+        "ts": entry.get("ts"),
+        "user_id": entry.get("user_id"),
+        "full_name": entry.get("full_name"),
+        "role": entry.get("role"),
+        "text": entry.get("text"),
+        "file": os.path.basename(source_file) if source_file else None,
+    }
+
+def publish_transcript_segments(entries_by_meeting):
+    """Add entries ({meeting_id: [entry, ...]}) to the meetings' live streams in one round-trip"""
+    pipe = r.pipeline(transaction=False)
+    for meeting_id, entries in entries_by_meeting.items():
+        if not entries:
+            continue
+        key = transcript_stream_key(meeting_id)
+        for entry in entries:
+            pipe.xadd(key, {"data": json.dumps(segment_event(entry), ensure_ascii=False)},
+                      maxlen=TRANSCRIPT_STREAM_MAXLEN, approximate=True)
+        pipe.expire(key, TRANSCRIPT_STREAM_TTL)
+    pipe.execute()
+
+def latest_transcript_event_id(meeting_id):
+    """ID of the newest segment in the stream, or "0-0" if it is empty"""
+    rows = r.xrevrange(transcript_stream_key(meeting_id), count=1)
+    return rows[0][0].decode() if rows else "0-0"
+
+def read_transcript_stream(meeting_id, last_id="0-0", block_ms=None, count=100):
+    """
+    Return [(event_id, segment), ...] added after last_id, oldest first.
+    With block_ms, wait up to that long for new segments (XREAD BLOCK).
+    """
+    response = r.xread({transcript_stream_key(meeting_id): last_id}, count=count, block=block_ms)
+    events = []
+    for _, rows in response or []:
+        for event_id, fields in rows:
+            events.append((event_id.decode(), json.loads(fields[b"data"])))
+    return events
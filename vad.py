@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Voice-activity detection for the STT pipeline.
+
+Runs on the 16 kHz mono float32 audio that whisper.load_audio returns, before
+the model sees it: chunks without speech are dropped and leading/trailing
+silence is trimmed. Uses webrtcvad when it is installed, otherwise a simple
+frame-energy detector (numpy only).
+"""
+import os
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1") == "1"
+# webrtcvad aggressiveness, 0 (least) .. 3 (most aggressive filtering)
+VAD_AGGRESSIVENESS = int(os.getenv("VAD_AGGRESSIVENESS", "2"))
+# Energy fallback: frames louder than this (dBFS) count as speech
+VAD_ENERGY_THRESHOLD_DB = float(os.getenv("VAD_ENERGY_THRESHOLD_DB", "-45"))
+# Chunks with less detected speech than this are skipped
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "300"))
+# Silence kept around the detected speech when trimming
+VAD_PADDING_MS = int(os.getenv("VAD_PADDING_MS", "300"))
+
+try:
+    import webrtcvad
+except ImportError:
+    webrtcvad = None
+
+
+def speech_frames(audio):
+    """Return one bool per FRAME_MS frame of audio: True if it contains speech"""
+    n_frames = len(audio) // FRAME_SAMPLES
+    if n_frames == 0:
+        return np.zeros(0, dtype=bool)
+    frames = audio[:n_frames * FRAME_SAMPLES].reshape(n_frames, FRAME_SAMPLES)
+
+    if webrtcvad is not None:
+        vad = webrtcvad.Vad(VAD_AGGRESSIVENESS)
+        pcm = (np.clip(frames, -1.0, 1.0) * 32767).astype("<i2")
+        return np.array([vad.is_speech(frame.tobytes(), SAMPLE_RATE) for frame in pcm], dtype=bool)
+
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    db = 20 * np.log10(np.maximum(rms, 1e-10))
+    return db > VAD_ENERGY_THRESHOLD_DB
+
+
+def trim_to_speech(audio):
+    """
+    Detect speech in a 16 kHz mono float32 array.
+
+    Returns (trimmed_audio, info). trimmed_audio is None when the chunk has
+    less than VAD_MIN_SPEECH_MS of speech; info describes what was removed.
+    """
+    duration_ms = len(audio) * 1000 // SAMPLE_RATE
+    flags = speech_frames(audio)
+    speech_ms = int(flags.sum()) * FRAME_MS
+    info = {"duration_ms": duration_ms, "speech_ms": speech_ms, "backend": "webrtcvad" if webrtcvad else "energy"}
+
+    if speech_ms < VAD_MIN_SPEECH_MS:
+        info["action"] = "skipped"
+        return None, info
+
+    speech_idx = np.flatnonzero(flags)
+    padding = VAD_PADDING_MS * SAMPLE_RATE // 1000
+    start = max(0, int(speech_idx[0]) * FRAME_SAMPLES - padding)
+    end = min(len(audio), (int(speech_idx[-1]) + 1) * FRAME_SAMPLES + padding)
+
+    info["action"] = "trimmed" if (start > 0 or end < len(audio)) else "kept"
+    info["trimmed_ms"] = (len(audio) - (end - start)) * 1000 // SAMPLE_RATE
+    return audio[start:end], info